@@ -1,9 +1,31 @@
+import time
+
+SCRIPT_STARTED = time.perf_counter()
+
 import streamlit as st
-import openai
 import os
-import random
-from PIL import Image, ImageDraw, ImageFont
-import textwrap
+import functools
+
+from request_scheduler import PRIORITY_BACKGROUND, run_with_priority
+from conversation_context import build_context_messages, summarize_turns, turns_to_summarize
+from letter_page import letter_section, render_debug_panel, vocabulary_toggle
+from postcard_core import (
+    DEFAULT_PROMPTS,
+    DEFAULT_STYLE,
+    TRANSLATION_BATCH_SIZE,
+    chat_completion,
+    configure_client,
+    get_background_executor,
+    get_client,
+    get_metrics,
+    get_render_workers,
+    translate_batch,
+    start_metrics_endpoint,
+)
+
+# Only light modules are imported above (Pillow, NumPy and openai load on
+# first use), so this is large only on a cold start
+IMPORT_SECONDS = time.perf_counter() - SCRIPT_STARTED
 
 # --------------------------
 # 1. CONFIGURATION & SETUP
@@ -20,208 +42,70 @@ if "user_name" not in st.session_state:
 if "friend_name" not in st.session_state:
     st.session_state["friend_name"] = "Zak"
 
-# Load OpenAI API key securely from Streamlit Secrets
+# Load OpenAI API key securely from Streamlit Secrets. The process-wide
+# pooled client is only built after the page is drawn (see main()).
 API_KEY = st.secrets["openai"]["api_key"]
-client = openai.Client(api_key=API_KEY)
-
-POSTCARD_FOLDER = "./Postcards"
-FONTS_FOLDER = "./Fonts"
-
-# Gather all available random fonts in FONTS_FOLDER (for Latin alphabets)
-FONT_FILES = [
-    os.path.join(FONTS_FOLDER, f)
-    for f in os.listdir(FONTS_FOLDER)
-    if f.lower().endswith(".ttf") and f.lower() not in ["cyrillic.ttf", "korean.ttf", "japanese.ttf", "chinese.ttf"]
-]
-
-# -------------------------
-# 2. GPT HELPER FUNCTIONS
-# -------------------------
-def generate_friend_letter(friend_name, user_name, target_language):
-    """
-    Generate a short letter (≈80 words) in target_language from friend_name to user_name.
-    """
-    prompt = (
-        f"Write a short (about 80 words) letter to your friend about a random activity on vacation. "
-        f"Ask a question to your friend. Write in {target_language} from {friend_name}'s point of view to {user_name} "
-        f"and sign the letter as {friend_name}."
-    )
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": "You are writing a letter from your holidays."},
-            {"role": "user", "content": prompt},
-        ],
-        max_tokens=300,
-        temperature=0.9
-    )
-    return response.choices[0].message.content.strip()
+configure_client(api_key=API_KEY)
 
-def translate_to_language(text, target_language):
+# --------------------
+# 2. CONVERSATION MODE FUNCTIONS
+# --------------------
+def apply_finished_summary():
     """
-    Ask ChatGPT to translate text into target_language.
+    Adopt the background conversation summary once it has landed.
+    A failed refresh is dropped and retried on a later turn.
     """
-    prompt = f"Please translate the following text into {target_language}:\n\n{text}."
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": "You are a translator who preserves the original meaning."},
-            {"role": "user", "content": prompt},
-        ],
-        max_tokens=300,
-        temperature=0.7
-    )
-    return response.choices[0].message.content.strip()
+    future = st.session_state.get("conversation_summary_future")
+    if future is None or not future.done():
+        return
+    del st.session_state["conversation_summary_future"]
+    try:
+        summary_text, summarized_count = future.result()
+    except Exception:
+        return
+    st.session_state["conversation_summary"] = {"text": summary_text, "covered": summarized_count}
 
-def correct_text_in_target_language(user_text, target_language, mother_tongue):
+def schedule_summary_refresh():
     """
-    Ask ChatGPT to correct and explain mistakes in user_text written in target_language.
+    Fold turns that left the verbatim window into the rolling summary on a
+    background thread, so the next reply does not wait for it.
     """
-    prompt = (
-        f"You are a language teacher. Correct the mistakes using {target_language} and then explain the mistakes in {mother_tongue}. "
-        f"First provide the corrected text in {target_language}, then a bullet list with explanations in {mother_tongue}.\n\n"
-        f"Text written in {target_language}:\n\n{user_text}"
+    if "conversation_summary_future" in st.session_state:
+        return
+    summary = st.session_state.get("conversation_summary", {"text": "", "covered": 0})
+    turns = turns_to_summarize(st.session_state["conversation_history"], summary["covered"])
+    if not turns:
+        return
+
+    def refresh():
+        return summarize_turns(functools.partial(chat_completion, stage="summary"), summary["text"], turns), summary["covered"] + len(turns)
+
+    st.session_state["conversation_summary_future"] = get_background_executor().submit(
+        run_with_priority, PRIORITY_BACKGROUND, refresh
     )
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": "You are a language teacher."},
-            {"role": "user", "content": prompt},
-        ],
-        max_tokens=300,
-        temperature=0.7
-    )
-    return response.choices[0].message.content.strip()
-
-# -------------------------
-# 2a. Caching for Translations
-# -------------------------
-@st.cache_data(show_spinner=False)
-def cached_translation(text, target_language):
-    return translate_to_language(text, target_language)
-
-# --------------------------------
-# 3. IMAGE & TEXT RENDERING LOGIC
-# --------------------------------
-def pick_random_postcard():
-    """
-    Pick a random image from POSTCARD_FOLDER.
-    """
-    image_files = [
-        os.path.join(POSTCARD_FOLDER, f)
-        for f in os.listdir(POSTCARD_FOLDER)
-        if f.lower().endswith((".png", ".jpg", ".jpeg"))
-    ]
-    return random.choice(image_files) if image_files else None
 
-def overlay_text_on_postcard(image_path, text, target_language):
-    """
-    Overlays the provided text on the postcard image.
-    - The postcard is first resized to a consistent size (600×400 pixels).
-    - The text area extends up to 60% of the postcard's width.
-    - A language-specific font is chosen if applicable.
-    - The font size is dynamically adjusted so that text appears at a consistent visual size.
-    """
-    # Open and resize the postcard image to a constant size (600x400)
-    postcard = Image.open(image_path).convert("RGBA")
-    target_size = (600, 400)
-    postcard = postcard.resize(target_size)
-    width, height = postcard.size
-
-    text_overlay = Image.new("RGBA", postcard.size, (255, 255, 255, 0))
-    draw = ImageDraw.Draw(text_overlay)
-
-    # Define letter area (left side)
-    margin_left = int(width * 0.03)
-    margin_top = int(height * 0.18)
-    max_text_width = int(width * 0.60)  # up to 60% of the postcard horizontally
-
-    # Determine font path based on target language (use specific fonts for non-Latin alphabets)
-    tl_lower = target_language.lower()
-    if tl_lower in ["russian", "ukrainian", "bulgarian", "serbian", "macedonian"]:
-        font_path = os.path.join(FONTS_FOLDER, "cyrillic.ttf")
-    elif tl_lower == "korean":
-        font_path = os.path.join(FONTS_FOLDER, "korean.ttf")
-    elif tl_lower == "japanese":
-        font_path = os.path.join(FONTS_FOLDER, "japanese.ttf")
-    elif tl_lower == "chinese":
-        font_path = os.path.join(FONTS_FOLDER, "chinese.ttf")
-    else:
-        font_path = random.choice(FONT_FILES) if FONT_FILES else None
-
-    # Define a baseline target for the character height (in pixels)
-    target_char_height = 14
-
-    # Start with an initial font size
-    init_font_size = 14
-    try:
-        # Attempt to load the font at the initial size
-        font = ImageFont.truetype(font_path, init_font_size) if font_path else ImageFont.load_default()
-    except Exception:
-        font = ImageFont.load_default()
-
-    # Function to measure text size safely
-    def measure_text(font_obj, text):
-        try:
-            return font_obj.getsize(text)
-        except AttributeError:
-            # Fallback to getbbox if getsize is not available
-            bbox = font_obj.getbbox(text)
-            return (bbox[2] - bbox[0], bbox[3] - bbox[1])
-
-    # If using a TrueType font, adjust the font size so that the rendered character "A" is close to target_char_height.
-    if font_path is not None:
-        ref_char = "A"
-        measured_width, measured_height = measure_text(font, ref_char)
-        # Avoid division by zero
-        if measured_height > 0:
-            adjusted_font_size = int(init_font_size * target_char_height / measured_height)
-            if adjusted_font_size != init_font_size:
-                try:
-                    font = ImageFont.truetype(font_path, adjusted_font_size)
-                except Exception:
-                    font = ImageFont.load_default()
-
-    # Compute an approximate maximum number of characters per line based on the average character width.
-    avg_char_width, _ = measure_text(font, "A")
-    max_chars = max(1, int(max_text_width // avg_char_width))
-
-    # Wrap text so that each line does not exceed the designated area.
-    wrapped_lines = []
-    for paragraph in text.split("\n"):
-        wrapped_lines.extend(
-            textwrap.wrap(paragraph, width=max_chars, break_long_words=True, break_on_hyphens=False)
-        )
-
-    # Draw each line on the overlay using a random dark color (RGB values between 0 and 100)
-    line_height = measure_text(font, "A")[1] + 6  # based on the adjusted font size with extra spacing
-    y_offset = margin_top
-    r, g, b = [random.randint(0, 100) for _ in range(3)]
-    color = (r, g, b, 255)
-
-    for line in wrapped_lines:
-        draw.text((margin_left, y_offset), line, font=font, fill=color)
-        y_offset += line_height
-
-    return Image.alpha_composite(postcard, text_overlay)
-
-# --------------------
-# 4. CONVERSATION MODE FUNCTIONS
-# --------------------
-def simulate_friend_response():
+def simulate_friend_response(stream=False):
     """
-    Uses the current conversation history stored in session_state to generate a friend reply.
-    The conversation context is maintained over multiple exchanges.
+    Generates a friend reply from the conversation stored in session_state.
+    Only the system prompt, a rolling summary of older turns and the latest
+    turns are sent, so the prompt size stays flat as the conversation grows.
+    With stream=True, the reply is written to the page token by token as it arrives.
     """
-    conversation_history = st.session_state["conversation_history"]
-    response = client.chat.completions.create(
+    apply_finished_summary()
+    summary = st.session_state.get("conversation_summary", {"text": "", "covered": 0})
+    messages = build_context_messages(st.session_state["conversation_history"], summary["text"], summary["covered"])
+    friend_reply = chat_completion(
         model="gpt-4o-mini",
-        messages=conversation_history,
+        messages=messages,
         max_tokens=300,
-        temperature=0.9
+        temperature=0.9,
+        stream=stream,
+        stage="conversation"
     )
-    friend_reply = response.choices[0].message.content.strip()
+    if stream:
+        friend_reply = st.write_stream(friend_reply).strip()
     st.session_state["conversation_history"].append({"role": "assistant", "content": friend_reply})
+    schedule_summary_refresh()
     return friend_reply
 
 def init_conversation():
@@ -239,10 +123,108 @@ def init_conversation():
             f"Engage in a lively, realistic conversation with your friend {user_name} while keeping your language level at {language_level}."
         )}
     ]
+    st.session_state.pop("conversation_summary", None)
+    st.session_state.pop("conversation_summary_future", None)
+    st.session_state["conversation_page"] = 0
     simulate_friend_response()
 
+def ensure_conversation_translations(messages, mother_tongue):
+    """
+    Translate the given conversation messages that have no mother_tongue
+    translation yet, in batched requests, and store the results on the
+    history entries.
+    """
+    missing = [msg for msg in messages if mother_tongue not in msg.get("translations", {})]
+    for start in range(0, len(missing), TRANSLATION_BATCH_SIZE):
+        batch = missing[start:start + TRANSLATION_BATCH_SIZE]
+        translations = translate_batch([msg["content"] for msg in batch], mother_tongue)
+        for msg, translation in zip(batch, translations):
+            msg.setdefault("translations", {})[mother_tongue] = translation
+
+# Messages rendered per page of the conversation view; older pages are
+# only drawn when the learner pages back to them
+CONVERSATION_PAGE_SIZE = 20
+
+def queue_user_message():
+    """
+    chat_input callback: add the learner's message to the history and jump
+    to the newest page. The reply is streamed when the fragment reruns.
+    """
+    user_message = st.session_state.get("conversation_input", "").strip()
+    if user_message and st.session_state.get("conversation_history"):
+        st.session_state["conversation_history"].append({"role": "user", "content": user_message})
+        st.session_state["conversation_page"] = 0
+
+def set_conversation_page(page):
+    st.session_state["conversation_page"] = page
+
+def conversation_window(history, page):
+    """
+    (messages, first, total) for one page of history, system message
+    excluded; page 0 holds the newest messages. first is the 1-based
+    position of the page's first message.
+    """
+    first_index = 1 if history and history[0]["role"] == "system" else 0
+    total = len(history) - first_index
+    end = max(total - page * CONVERSATION_PAGE_SIZE, 0)
+    start = max(end - CONVERSATION_PAGE_SIZE, 0)
+    return history[first_index + start:first_index + end], start + 1, total
+
+@st.fragment
+def conversation_view(friend_name, target_language, mother_tongue):
+    """
+    Conversation mode as a fragment: sending a message, paging or toggling
+    translations reruns only this view, and only one page of the history
+    is rendered, so a chat turn costs the same however long the history is.
+    """
+    # Option to reset or start a new conversation
+    if st.button("🔄 Reset Conversation"):
+        init_conversation()
+
+    # Initialize conversation if not already started
+    if not st.session_state.get("conversation_history"):
+        if st.button("▶️ Start New Conversation"):
+            init_conversation()
+        else:
+            return
+
+    history = st.session_state["conversation_history"]
+    page = st.session_state.get("conversation_page", 0)
+    messages, first, total = conversation_window(history, page)
+
+    st.subheader("Conversation History")
+    # Translations are only requested for the messages on screen, when asked
+    # for, in one batch, and kept on the history entries so reruns cost nothing.
+    show_translations = st.toggle(f"🌐 Show translations in {mother_tongue}")
+    if show_translations:
+        with st.spinner("Translating conversation..."):
+            ensure_conversation_translations(messages, mother_tongue)
+
+    if total > CONVERSATION_PAGE_SIZE:
+        older, position, newer = st.columns([1, 3, 1])
+        older.button("⬆️ Older", disabled=first == 1, on_click=set_conversation_page, args=(page + 1,))
+        position.caption(f"Messages {first}–{first + len(messages) - 1} of {total}")
+        newer.button("⬇️ Newer", disabled=page == 0, on_click=set_conversation_page, args=(page - 1,))
+
+    for msg in messages:
+        with st.chat_message(msg["role"]):
+            st.markdown(msg["content"])
+            if show_translations and mother_tongue in msg.get("translations", {}):
+                st.caption(msg["translations"][mother_tongue])
+
+    # A message queued by the chat input is answered here, streamed under it
+    if page == 0 and history[-1]["role"] == "user":
+        with st.chat_message("assistant"):
+            simulate_friend_response(stream=True)
+
+    st.chat_input(
+        f"Write to {friend_name} in {target_language}...",
+        key="conversation_input",
+        on_submit=queue_user_message
+    )
+
 # --------------------
-# 5. STREAMLIT APP FUNCTIONS
+# 3. STREAMLIT APP FUNCTIONS
 # --------------------
 def load_css(css_file_path):
     """
@@ -285,6 +267,8 @@ def main():
         st.session_state["language_level"] = edited_language_level
         st.sidebar.success("✅ Language settings saved!")
 
+    with_vocabulary = vocabulary_toggle()
+
     # Retrieve current settings from session_state
     mother_tongue = st.session_state["mother_tongue"]
     target_language = st.session_state["target_language"]
@@ -292,55 +276,17 @@ def main():
     user_name = st.session_state["user_name"]
     friend_name = st.session_state["friend_name"]
 
+    render_debug_panel()
+    # Title and sidebar are on screen: everything below may do heavy work
+    get_metrics().record_startup(IMPORT_SECONDS, time.perf_counter() - SCRIPT_STARTED)
+
     # ---------------------------
     # Main Page: Generate Postcard Letter
     # ---------------------------
-    if "postcard_path" not in st.session_state:
-        st.session_state["postcard_path"] = pick_random_postcard()
-
-    if st.button("✉️ Generate Letter"):
-        if not st.session_state["postcard_path"]:
-            st.error("❌ No postcard images found. Please check your POSTCARD_FOLDER path.")
-        else:
-            with st.spinner("Generating your personalized letter..."):
-                # Generate the letter in the target language
-                letter_text = generate_friend_letter(friend_name, user_name, target_language)
-                st.session_state["letter_text"] = letter_text
-
-                # Create the final postcard with the overlaid letter text
-                final_postcard = overlay_text_on_postcard(st.session_state["postcard_path"], letter_text, target_language)
-                st.session_state["final_postcard"] = final_postcard
-
-                # Also store the translation (from target language to mother tongue)
-                st.session_state["letter_translation"] = translate_to_language(letter_text, mother_tongue)
-            st.success("✅ Letter generated successfully!")
-
-    if "final_postcard" in st.session_state:
-        st.image(
-            st.session_state["final_postcard"],
-            caption=f"✉️ Letter from {friend_name} to {user_name}",
-            use_container_width=True
-        )
-
-        st.subheader("🧐 Guess the Translation")
-        guess = st.text_area(f"Your guess in {mother_tongue}:")
-
-        if st.button("🔍 Reveal ChatGPT Translation"):
-            if "letter_translation" in st.session_state:
-                st.write(st.session_state["letter_translation"])
-            else:
-                st.info("ℹ️ You have not generated a letter yet.")
-
-        st.subheader(f"💬 Reply to the Letter in {target_language}")
-        user_reply = st.text_area(f"Write your reply in {target_language}:")
-
-        if st.button("✅ Correct My Reply"):
-            if user_reply.strip():
-                with st.spinner("🔧 Correcting your reply..."):
-                    corrected = correct_text_in_target_language(user_reply, target_language, mother_tongue)
-                    st.write(corrected)
-            else:
-                st.info("ℹ️ Please enter some text to correct.")
+    letter_section(
+        friend_name, user_name, target_language, language_level, mother_tongue,
+        DEFAULT_PROMPTS, DEFAULT_STYLE, with_vocabulary
+    )
 
     # ---------------------------
     # Conversation Mode Section
@@ -349,40 +295,14 @@ def main():
     st.write("Engage in a natural, back-and-forth chat with your AI friend to practice your target language. "
              "Your conversation history is maintained to provide context across multiple exchanges.")
 
-    # Option to reset or start a new conversation
-    if st.button("🔄 Reset Conversation"):
-        init_conversation()
-        st.experimental_rerun()
+    conversation_view(friend_name, target_language, mother_tongue)
 
-    # Initialize conversation if not already started
-    if "conversation_history" not in st.session_state or st.session_state.get("conversation_history") is None:
-        if st.button("▶️ Start New Conversation"):
-            init_conversation()
-            st.experimental_rerun()
-
-    # Display conversation history (excluding the system message)
-    if "conversation_history" in st.session_state and st.session_state["conversation_history"]:
-        st.subheader("Conversation History")
-        for i, msg in enumerate(st.session_state["conversation_history"]):
-            if msg["role"] == "system":
-                continue  # Skip system messages
-            if msg["role"] == "assistant":
-                st.markdown(f"**{friend_name}:** {msg['content']}")
-            elif msg["role"] == "user":
-                st.markdown(f"**{user_name}:** {msg['content']}")
-            with st.expander("Show Translation"):
-                translation = cached_translation(msg["content"], mother_tongue)
-                st.markdown(translation)
-
-        # Form for user to send a new message
-        with st.form("conversation_form", clear_on_submit=True):
-            user_message = st.text_area("Your Message:", height=100)
-            submitted = st.form_submit_button("Send")
-            if submitted and user_message.strip():
-                st.session_state["conversation_history"].append({"role": "user", "content": user_message})
-                with st.spinner("Waiting for friend response..."):
-                    simulate_friend_response()
-                st.experimental_rerun()
+    # Build the pooled OpenAI client (and start its warm-up) and the render
+    # worker processes once the page is drawn, if prefetching has not already
+    # done so, and expose the metrics endpoint
+    get_client()
+    get_render_workers()
+    start_metrics_endpoint()
 
 if __name__ == "__main__":
     main()
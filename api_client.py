@@ -0,0 +1,67 @@
+import importlib.util
+import os
+import threading
+
+import httpx
+import openai
+
+from request_scheduler import MAX_CONCURRENCY
+
+# --------------------------
+# SHARED OPENAI CLIENT
+# --------------------------
+# One OpenAI client per process, on one httpx connection pool: connections
+# are kept alive between requests, so generations, translations and
+# corrections skip TCP and TLS setup after the first call. With the optional
+# h2 package installed, requests are multiplexed over HTTP/2. A warm-up
+# request opens the first connection as soon as the client is built, before
+# any learner is waiting.
+
+# The scheduler admits MAX_CONCURRENCY calls at once; a few spare connections
+# cover streams that are still being closed while the next call starts
+MAX_CONNECTIONS = MAX_CONCURRENCY + 4
+KEEPALIVE_EXPIRY = float(os.environ.get("POSTCARD_OPENAI_KEEPALIVE", "120"))
+CONNECT_TIMEOUT = 5.0
+READ_TIMEOUT = 60.0  # per read: a stream only needs a chunk every READ_TIMEOUT seconds
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+WARM_UP_MODEL = "gpt-4o-mini"
+
+
+def build_http_client(http2=HTTP2_AVAILABLE):
+    """
+    httpx client with keep-alive pool limits sized for the request scheduler.
+    """
+    return httpx.Client(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+        follow_redirects=True,
+    )
+
+
+def build_client(api_key=None, base_url=None, warm_up=True):
+    """
+    OpenAI client on a pooled httpx transport. Retries are left to the
+    request scheduler. With warm_up, a connection is opened in the
+    background (see warm_up_client()).
+    """
+    client = openai.Client(api_key=api_key, base_url=base_url, max_retries=0, http_client=build_http_client())
+    if warm_up:
+        threading.Thread(target=warm_up_client, args=(client,), name="openai-warm-up", daemon=True).start()
+    return client
+
+
+def warm_up_client(client):
+    """
+    Open a pooled connection with a cheap authenticated request (no tokens
+    are spent). Returns False if the API could not be reached.
+    """
+    try:
+        client.models.retrieve(WARM_UP_MODEL)
+    except openai.OpenAIError:
+        return False
+    return True
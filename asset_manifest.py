@@ -0,0 +1,171 @@
+import argparse
+import json
+import os
+import struct
+import sys
+import threading
+
+from font_index import read_cmap_ranges
+from postcard_pool import IMAGE_EXTENSIONS
+
+# --------------------------
+# ASSET MANIFEST
+# --------------------------
+# Fonts (with the codepoints their cmap covers, which FontCoverageIndex
+# searches) and postcards (with their pixel size, which PostcardPool plans
+# native-resolution cards at), plus each file's size and mtime, in one JSON
+# file. A server process starts from it with a few stat() calls instead of
+# listing folders, parsing font tables or opening images: a folder is only
+# listed again when its mtime changed, and an entry is only rebuilt when its
+# file's size or mtime did. Building it ahead of time (e.g. in a deploy
+# image) saves even the first build:
+#
+#     python asset_manifest.py
+
+MANIFEST_VERSION = 2
+# POSTCARD_ASSET_MANIFEST lets deployments bake the manifest into the image
+DEFAULT_MANIFEST_PATH = os.environ.get("POSTCARD_ASSET_MANIFEST", os.path.join(".cache", "asset_manifest.json"))
+FONT_EXTENSIONS = (".ttf", ".otf")
+
+def _font_entry(path):
+    try:
+        ranges = read_cmap_ranges(path)
+    except (OSError, struct.error):
+        ranges = []  # unreadable font: listed, but covering nothing
+    return {"ranges": ranges}
+
+
+def _postcard_entry(path):
+    from PIL import Image  # only opened for new or changed postcards
+
+    with Image.open(path) as img:  # reads the header, not the pixels
+        width, height = img.size
+    return {"width": width, "height": height}
+
+
+class AssetManifest:
+    """
+    Font and postcard metadata for two folders, persisted to path.
+    Read-only after construction apart from refresh(); thread-safe.
+    """
+
+    def __init__(self, fonts_folder, postcards_folder, path=DEFAULT_MANIFEST_PATH):
+        self.fonts_folder = fonts_folder
+        self.postcards_folder = postcards_folder
+        self.path = path
+        self.rebuilt = []  # names of the entries (re)built by the last refresh()
+        self._folders = {}
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self):
+        """
+        Re-check every file's size and mtime against the stored manifest,
+        rebuild the entries that changed and save the manifest if needed.
+        """
+        stored = self._load()
+        folders, rebuilt = {}, []
+        for kind, folder, extensions, build in (
+            ("fonts", self.fonts_folder, FONT_EXTENSIONS, _font_entry),
+            ("postcards", self.postcards_folder, IMAGE_EXTENSIONS, _postcard_entry),
+        ):
+            folders[kind] = self._refresh_folder(folder, extensions, build, stored.get(kind, {}), rebuilt)
+        with self._lock:
+            self._folders = folders
+            self.rebuilt = rebuilt
+        if folders != stored:
+            self._save(folders)
+
+    def font_paths(self):
+        return self._paths("fonts", self.fonts_folder)
+
+    def postcard_paths(self):
+        return self._paths("postcards", self.postcards_folder)
+
+    def folder_mtime(self, kind):
+        """
+        mtime of the "fonts" or "postcards" folder when the manifest was checked.
+        """
+        return self._folders[kind]["mtime"]
+
+    def font(self, font_path):
+        """
+        {"size", "mtime_ns", "ranges"} for font_path, or None.
+        """
+        return self._folders["fonts"]["files"].get(os.path.basename(font_path))
+
+    def postcard(self, image_path):
+        """
+        {"size", "mtime_ns", "width", "height"} for image_path, or None.
+        """
+        return self._folders["postcards"]["files"].get(os.path.basename(image_path))
+
+    def _paths(self, kind, folder):
+        with self._lock:
+            return [os.path.join(folder, name) for name in self._folders[kind]["files"]]
+
+    def _refresh_folder(self, folder, extensions, build, stored, rebuilt):
+        stored_files = stored.get("files", {})
+        try:
+            mtime = os.path.getmtime(folder)
+            if mtime == stored.get("mtime"):
+                names = list(stored_files)  # no file added, removed or renamed since the last check
+            else:
+                names = sorted(name for name in os.listdir(folder) if name.lower().endswith(extensions))
+        except OSError:
+            return {"mtime": None, "files": {}}
+        files = {}
+        for name in names:
+            path = os.path.join(folder, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entry = stored_files.get(name)
+            if entry is None or entry["size"] != stat.st_size or entry["mtime_ns"] != stat.st_mtime_ns:
+                try:
+                    entry = dict(build(path), size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+                except OSError:
+                    continue  # unreadable file: left out until the next refresh
+                rebuilt.append(name)
+            files[name] = entry
+        return {"mtime": mtime, "files": files}
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if data.get("version") != MANIFEST_VERSION:
+            return {}
+        return data.get("folders", {})
+
+    def _save(self, folders):
+        directory = os.path.dirname(self.path)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": MANIFEST_VERSION, "folders": folders}, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass  # not saved: the next start scans the folders again
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or refresh the font and postcard asset manifest.")
+    parser.add_argument("--fonts", default="./Fonts", help="fonts folder (default: ./Fonts)")
+    parser.add_argument("--postcards", default="./Postcards", help="postcards folder (default: ./Postcards)")
+    parser.add_argument("--out", default=DEFAULT_MANIFEST_PATH, help=f"manifest path (default: {DEFAULT_MANIFEST_PATH})")
+    args = parser.parse_args(argv)
+
+    manifest = AssetManifest(args.fonts, args.postcards, args.out)
+    print(f"{len(manifest.font_paths())} fonts, {len(manifest.postcard_paths())} postcards, "
+          f"{len(manifest.rebuilt)} entries rebuilt -> {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,268 @@
+"""
+Headless batch postcard generation.
+
+Produces a letter, its translation and a rendered postcard for every
+combination of learner x target language x level, without Streamlit:
+
+    python batch_postcards.py --learners "Guigs:Zak,Anna:Piotr" \
+        --languages Polish,Russian --levels A2,B1 --mother-tongue English \
+        --per-combination 3 --out class_5b/
+
+LLM calls run concurrently under --concurrency, rendering runs in a
+process pool (--workers). Every finished card is appended to a JSONL
+manifest, and re-running the same command skips cards already listed
+there, so an interrupted job can simply be restarted. With --zip the
+images are staged in a <name>.parts directory and packed into the zip
+archive when the run ends; the manifest sits next to the archive. A killed
+--zip run leaves the staged images and resumes from them like a
+directory run.
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import random
+import re
+import shutil
+import sys
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from postcard_core import generate_letter_bundle, overlay_text_on_postcard, pick_random_postcard
+
+
+def slugify(value):
+    return re.sub(r"[^a-z0-9]+", "-", value.lower()).strip("-") or "x"
+
+
+def plan_jobs(learners, languages, levels, mother_tongue, per_combination):
+    """
+    Deterministic list of jobs; each job id is stable across runs so the
+    manifest can be used to resume.
+    """
+    jobs = []
+    for user_name, friend_name in learners:
+        for target_language in languages:
+            for language_level in levels:
+                for index in range(per_combination):
+                    job_id = "-".join(slugify(part) for part in (user_name, friend_name, target_language, language_level))
+                    jobs.append({
+                        "id": f"{job_id}-{index + 1:03d}",
+                        "user_name": user_name,
+                        "friend_name": friend_name,
+                        "target_language": target_language,
+                        "language_level": language_level,
+                        "mother_tongue": mother_tongue,
+                    })
+    return jobs
+
+
+def write_letter(job):
+    """
+    LLM stage (runs on a thread): letter, translation, key vocabulary and
+    the postcard to use, from one structured request when possible.
+    """
+    bundle = generate_letter_bundle(
+        job["friend_name"], job["user_name"], job["target_language"], job["mother_tongue"],
+        language_level=job["language_level"]
+    )
+    return dict(
+        job,
+        letter=bundle.letter,
+        translation=bundle.translation,
+        vocabulary=bundle.vocabulary,
+        postcard=pick_random_postcard(),
+        style_seed=random.getrandbits(32),
+    )
+
+
+def render_card(postcard_path, letter_text, target_language, style_seed, image_format):
+    """
+    Render stage (runs in a worker process). Returns encoded image bytes so
+    only a compressed payload crosses the process boundary.
+    """
+    card = overlay_text_on_postcard(postcard_path, letter_text, target_language, style_seed)
+    buffer = io.BytesIO()
+    if image_format == "jpg":
+        card.convert("RGB").save(buffer, format="JPEG", quality=90, optimize=True)
+    else:
+        card.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+
+class BatchOutput:
+    """
+    Writes images to a directory and appends manifest lines. With use_zip,
+    images are staged in a directory next to the archive and close() packs
+    them into it, so an interrupted run never leaves a half-written archive.
+    """
+
+    def __init__(self, out_path, use_zip):
+        self.out_path = out_path
+        self.use_zip = use_zip
+        if use_zip:
+            base = os.path.splitext(out_path)[0]
+            self.manifest_path = base + ".jsonl"
+            self.image_dir = base + ".parts"
+        else:
+            self.manifest_path = os.path.join(out_path, "manifest.jsonl")
+            self.image_dir = out_path
+        os.makedirs(self.image_dir, exist_ok=True)
+
+    def resume(self):
+        """
+        Ids of the cards already written (listed in the manifest, image
+        staged or archived). Rewrites the manifest with one line per such
+        card, dropping duplicates, lines cut short and cards whose image is gone.
+        """
+        if not os.path.exists(self.manifest_path):
+            return set()
+        images = self._staged_names() | self._archived_names()
+        entries = {}
+        with open(self.manifest_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    job_id, image = entry["id"], entry["image"]
+                except (ValueError, KeyError, TypeError):
+                    continue  # a line cut short by an interruption
+                if image in images:
+                    entries[job_id] = entry  # a card written twice keeps its last line
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in entries.values():
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.manifest_path)
+        return set(entries)
+
+    def write(self, record, image_bytes, image_format):
+        file_name = f"{record['id']}.{image_format}"
+        # Write then rename so a half-written image never looks complete
+        tmp_path = os.path.join(self.image_dir, file_name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(image_bytes)
+        os.replace(tmp_path, os.path.join(self.image_dir, file_name))
+        entry = {key: value for key, value in record.items() if key != "style_seed"}
+        entry["image"] = file_name
+        with open(self.manifest_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def close(self):
+        """
+        With use_zip, write a new archive holding the previous archive's
+        images and the staged ones, swap it in and remove the staging directory.
+        """
+        if not self.use_zip:
+            return
+        staged = self._staged_names()
+        carried = sorted(self._archived_names() - staged)
+        tmp_path = self.out_path + ".tmp"
+        with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_STORED) as archive:
+            if carried:
+                with zipfile.ZipFile(self.out_path) as previous:
+                    for name in carried:
+                        archive.writestr(previous.getinfo(name), previous.read(name))
+            for name in sorted(staged):
+                archive.write(os.path.join(self.image_dir, name), name)
+        os.replace(tmp_path, self.out_path)
+        shutil.rmtree(self.image_dir)
+
+    def _staged_names(self):
+        return {
+            name for name in os.listdir(self.image_dir)
+            if not name.endswith(".tmp") and os.path.join(self.image_dir, name) != self.manifest_path
+        }
+
+    def _archived_names(self):
+        if not self.use_zip or not os.path.exists(self.out_path):
+            return set()
+        try:
+            with zipfile.ZipFile(self.out_path) as archive:
+                return set(archive.namelist())
+        except zipfile.BadZipFile:
+            return set()  # left by an older, killed run: its images are regenerated
+
+
+def run_batch(jobs, output, concurrency, workers, image_format, log=print):
+    """
+    Pipeline jobs through the LLM thread pool and the render process pool,
+    writing each card as soon as it is rendered. Returns (written, failed).
+    """
+    written = failed = 0
+    # Spawned, not forked: the first render is submitted while LLM threads may
+    # hold the metrics or scheduler locks, and a forked child would inherit them held
+    render_context = multiprocessing.get_context("spawn")
+    with ThreadPoolExecutor(max_workers=concurrency) as llm_pool, \
+            ProcessPoolExecutor(max_workers=workers, mp_context=render_context) as render_pool:
+        pending = {llm_pool.submit(write_letter, job): ("letter", job) for job in jobs}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, record = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as exc:
+                    failed += 1
+                    log(f"[{record['id']}] {stage} failed: {exc}")
+                    continue
+                if stage == "letter":
+                    render = render_pool.submit(
+                        render_card, result["postcard"], result["letter"],
+                        result["target_language"], result["style_seed"], image_format
+                    )
+                    pending[render] = ("render", result)
+                else:
+                    output.write(record, result, image_format)
+                    written += 1
+                    log(f"[{record['id']}] done ({written}/{len(jobs)})")
+    return written, failed
+
+
+def parse_learners(value):
+    learners = []
+    for pair in value.split(","):
+        user_name, _, friend_name = pair.partition(":")
+        if not user_name.strip() or not friend_name.strip():
+            raise argparse.ArgumentTypeError(f"expected 'Learner:Friend', got {pair!r}")
+        learners.append((user_name.strip(), friend_name.strip()))
+    return learners
+
+
+def parse_list(value):
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate postcards in bulk without the Streamlit UI.")
+    parser.add_argument("--learners", type=parse_learners, required=True,
+                        help="comma-separated Learner:Friend pairs, e.g. 'Guigs:Zak,Anna:Piotr'")
+    parser.add_argument("--languages", type=parse_list, required=True, help="comma-separated target languages")
+    parser.add_argument("--levels", type=parse_list, default=["B1"], help="comma-separated CEFR levels (default: B1)")
+    parser.add_argument("--mother-tongue", default="English", help="language of the translations (default: English)")
+    parser.add_argument("--per-combination", type=int, default=1, help="cards per learner/language/level (default: 1)")
+    parser.add_argument("--out", required=True, help="output directory, or zip file with --zip")
+    parser.add_argument("--zip", action="store_true", help="write images into the --out zip archive")
+    parser.add_argument("--format", choices=["png", "jpg"], default="png", help="image format (default: png)")
+    parser.add_argument("--concurrency", type=int, default=4, help="max concurrent LLM jobs (default: 4)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="render processes (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    if not pick_random_postcard():
+        parser.error("no postcard images found; run from the repository root")
+
+    output = BatchOutput(args.out, args.zip)
+    try:
+        jobs = plan_jobs(args.learners, args.languages, args.levels, args.mother_tongue, args.per_combination)
+        done = output.resume()
+        remaining = [job for job in jobs if job["id"] not in done]
+        print(f"{len(jobs)} cards planned, {len(jobs) - len(remaining)} already done, {len(remaining)} to generate")
+        written, failed = run_batch(remaining, output, args.concurrency, args.workers, args.format)
+    finally:
+        output.close()
+    print(f"Wrote {written} cards to {args.out} ({failed} failed); manifest: {output.manifest_path}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
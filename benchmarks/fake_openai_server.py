@@ -0,0 +1,145 @@
+"""
+Local stand-in for the OpenAI chat-completions endpoint.
+
+Replies are canned letters in the script matching the requested language
+(Latin, Cyrillic or CJK), delivered after a configurable first-token
+latency and at a configurable token rate, with or without streaming. Every
+reply carries a request counter so identical prompts never hit the
+response cache by accident.
+"""
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SAMPLE_LETTERS = {
+    "latin": (
+        "Cześć Guigs! Jestem teraz nad morzem w Gdańsku i codziennie rano pływam kajakiem po zatoce. "
+        "Wczoraj widziałem foki, które odpoczywały na piasku. Wieczorem jemy świeże ryby i słuchamy muzyki na plaży. "
+        "Pogoda jest piękna, chociaż wiatr bywa silny. A ty, jak spędzasz wakacje? Czy masz jakieś plany na sierpień? "
+        "Pozdrawiam serdecznie, Zak"
+    ),
+    "cyrillic": (
+        "Привет, Гиг! Я сейчас на море в Сочи и каждое утро плаваю на каяке вдоль берега. "
+        "Вчера я видел дельфинов недалеко от пляжа. Вечером мы едим свежую рыбу и слушаем музыку у моря. "
+        "Погода прекрасная, хотя иногда дует сильный ветер. А как ты проводишь отпуск? Какие у тебя планы на август? "
+        "С наилучшими пожеланиями, Зак"
+    ),
+    "cjk": (
+        "你好，吉格斯！我现在在海边度假，每天早上都去划皮划艇。昨天我看到了海豹在沙滩上休息。"
+        "晚上我们吃新鲜的鱼，在海滩上听音乐。天气很好，虽然有时候风很大。你的假期过得怎么样？八月有什么计划吗？"
+        "祝好，扎克"
+    ),
+}
+
+CYRILLIC_LANGUAGES = ("russian", "ukrainian", "bulgarian", "serbian", "macedonian")
+CJK_LANGUAGES = ("chinese", "japanese", "korean")
+
+
+def pick_sample(messages):
+    prompt = " ".join(str(msg.get("content", "")) for msg in messages).lower()
+    if any(language in prompt for language in CJK_LANGUAGES):
+        return SAMPLE_LETTERS["cjk"]
+    if any(language in prompt for language in CYRILLIC_LANGUAGES):
+        return SAMPLE_LETTERS["cyrillic"]
+    return SAMPLE_LETTERS["latin"]
+
+
+def split_tokens(text):
+    """
+    Pseudo-tokens: words for spaced scripts, 2-character slices for CJK.
+    """
+    if " " in text:
+        words = text.split(" ")
+        return [word + " " for word in words[:-1]] + words[-1:]
+    return [text[i:i + 2] for i in range(0, len(text), 2)]
+
+
+class FakeChatHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass  # keep benchmark output readable
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        server = self.server
+        counter = next(server.counter)
+        text = f"{pick_sample(request.get('messages', []))} (#{counter})"
+        tokens = split_tokens(text)
+        model = request.get("model", "fake-model")
+
+        time.sleep(server.latency)
+        if request.get("stream"):
+            self._stream(tokens, model, server.tokens_per_second)
+        else:
+            time.sleep(len(tokens) / server.tokens_per_second)
+            self._send_json({
+                "id": f"chatcmpl-bench-{counter}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": length // 4, "completion_tokens": len(tokens),
+                          "total_tokens": length // 4 + len(tokens)},
+            })
+
+    def _send_json(self, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, tokens, model, tokens_per_second):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for token in tokens:
+            chunk = {
+                "id": "chatcmpl-bench",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(1 / tokens_per_second)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    """
+    Threaded fake server; use as a context manager to run it in the background.
+    base_url is suitable for openai.Client(base_url=...).
+    """
+
+    daemon_threads = True
+
+    def __init__(self, latency=0.3, tokens_per_second=60.0, host="127.0.0.1", port=0):
+        super().__init__((host, port), FakeChatHandler)
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.counter = itertools.count(1)
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
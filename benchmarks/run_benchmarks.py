@@ -0,0 +1,374 @@
+"""
+Benchmarks for the render and generation pipeline.
+
+Runs against a local fake chat-completions server (no OpenAI calls, no
+cost) and reports p50/p95/p99 latency, throughput and peak RSS for:
+
+- render:       overlay_text_on_postcard across postcards, scripts
+                (Latin, Cyrillic, CJK) and letter lengths
+- generation:   the app's Generate Letter flow (streamed letter with
+                sentence previews, translation overlapping the final render)
+- conversation: successive turns with bounded context
+- composite:    full-frame overlay vs. tight text-layer compositing (on a
+                shared or an owned background) on the largest postcard at
+                native resolution, up to the RGB frame the encoder takes,
+                with the peak RSS each one adds measured in a fresh process
+                (Linux /proc; "n/a" elsewhere)
+
+Usage (from the repository root):
+
+    python -m benchmarks.run_benchmarks                    # run and compare
+    python -m benchmarks.run_benchmarks --save-baseline    # store new baseline
+    python -m benchmarks.run_benchmarks --only render --iterations 50
+
+Exits with status 1 if a metric regressed beyond --tolerance compared to
+the stored baseline (benchmarks/baseline.json). The committed baseline was
+recorded on one development machine; latencies are only comparable on
+similar hardware, so re-record it with --save-baseline before relying on
+the comparison elsewhere. Metrics without a baseline entry are marked
+"NO BASELINE" and a missing baseline file is reported on stderr: neither
+can fail the run.
+"""
+import argparse
+import functools
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+# Benchmarks must not read from or pollute the real response cache
+os.environ.setdefault("POSTCARD_LLM_CACHE_PATH", os.path.join(tempfile.mkdtemp(prefix="postcard-bench-"), "cache.sqlite3"))
+
+from PIL import Image, ImageDraw
+
+import postcard_core
+from api_client import build_client
+from benchmarks.fake_openai_server import SAMPLE_LETTERS, FakeOpenAIServer
+from conversation_context import build_context_messages
+from letter_page import stream_letter_with_preview
+from postcard_pool import load_background
+from text_layout import draw_layout
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+SCRIPTS = {"latin": "Polish", "cyrillic": "Russian", "cjk": "Chinese"}
+
+
+# --------------------------
+# MEASUREMENT HELPERS
+# --------------------------
+def percentile(sorted_values, fraction):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS; peak is process-wide and cumulative
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def summarize(samples, wall_time):
+    values = sorted(samples)
+    return {
+        "count": len(values),
+        "p50_ms": percentile(values, 0.50) * 1000,
+        "p95_ms": percentile(values, 0.95) * 1000,
+        "p99_ms": percentile(values, 0.99) * 1000,
+        "throughput_per_s": len(values) / wall_time if wall_time > 0 else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def timed(samples, fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    samples.append(time.perf_counter() - start)
+    return result
+
+
+def first_chunk_timed(chunks, samples, t0):
+    """
+    Pass chunks through, recording the time to the first one in samples.
+    """
+    for index, chunk in enumerate(chunks):
+        if index == 0:
+            samples.append(time.perf_counter() - t0)
+        yield chunk
+
+
+def letter_of_length(script, words):
+    """
+    Sample letter trimmed or repeated to roughly the requested word count
+    (CJK counts two characters per word).
+    """
+    sample = SAMPLE_LETTERS[script]
+    if script == "cjk":
+        return (sample * (words * 2 // len(sample) + 1))[:words * 2]
+    tokens = sample.split(" ")
+    return " ".join((tokens * (words // len(tokens) + 1))[:words])
+
+
+# --------------------------
+# BENCHMARKS
+# --------------------------
+def bench_render(iterations):
+    # Measure steady-state renders: fonts measured and backgrounds decoded up front
+    postcard_core.get_font_registry()
+    postcard_core.get_postcard_pool().warm_up()
+    postcards = postcard_core.get_postcard_pool().paths()
+    results = {}
+    for script, language in SCRIPTS.items():
+        for label, words in (("short", 20), ("medium", 80), ("long", 160)):
+            text = letter_of_length(script, words)
+            samples = []
+            start = time.perf_counter()
+            for i in range(iterations):
+                timed(samples, postcard_core.overlay_text_on_postcard, postcards[i % len(postcards)], text, language, i)
+            results[f"render.{script}.{label}"] = summarize(samples, time.perf_counter() - start)
+    return results
+
+
+def bench_generation(iterations):
+    first_token, postcard_ready, total = [], [], []
+    postcards = postcard_core.get_postcard_pool().paths()
+    start = time.perf_counter()
+    for i in range(iterations):
+        language = list(SCRIPTS.values())[i % len(SCRIPTS)]
+        postcard_path = postcards[i % len(postcards)]
+        t0 = time.perf_counter()
+        letter_text = stream_letter_with_preview(
+            first_chunk_timed(postcard_core.generate_friend_letter("Zak", "Guigs", language, stream=True), first_token, t0),
+            lambda partial: postcard_core.overlay_text_on_postcard(postcard_path, partial, language, i)
+        )
+        translation = postcard_core.get_background_executor().submit(
+            postcard_core.translate_to_language, letter_text, "English"
+        )
+        postcard_core.overlay_text_on_postcard(postcard_path, letter_text, language, i)
+        postcard_ready.append(time.perf_counter() - t0)
+        translation.result()
+        total.append(time.perf_counter() - t0)
+    wall_time = time.perf_counter() - start
+    return {
+        "generation.first_token": summarize(first_token, wall_time),
+        "generation.postcard_ready": summarize(postcard_ready, wall_time),
+        "generation.total": summarize(total, wall_time),
+    }
+
+
+def bench_conversation(iterations):
+    history = [{"role": "system", "content": "You are Zak, a friendly language partner conversing in Polish."}]
+    samples = []
+    start = time.perf_counter()
+    for i in range(iterations):
+        history.append({"role": "user", "content": f"{letter_of_length('latin', 30)} ({i})"})
+        reply = timed(
+            samples,
+            lambda: postcard_core.chat_completion(
+                model="gpt-4o-mini", messages=build_context_messages(history), max_tokens=300, temperature=0.9
+            ),
+        )
+        history.append({"role": "assistant", "content": reply})
+    return {"conversation.turn": summarize(samples, time.perf_counter() - start)}
+
+
+def composite_full_frame(background, layout, font, origin, fill):
+    """
+    The previous approach, kept for comparison: a transparent overlay the
+    size of the whole postcard, composited over the whole frame.
+    """
+    overlay = Image.new("RGBA", background.size, (255, 255, 255, 0))
+    draw = ImageDraw.Draw(overlay)
+    y_offset = origin[1]
+    for line in layout.lines:
+        draw.text((origin[0], y_offset), line, font=font, fill=fill)
+        y_offset += layout.line_height
+    return Image.alpha_composite(background, overlay)
+
+
+def encoder_frame(draw):
+    """
+    draw followed by the conversion to the opaque RGB frame the encoders
+    take (see image_store.encode_image), which RGB results skip.
+    """
+    def composite(*args, **kwargs):
+        image = draw(*args, **kwargs)
+        return image if image.mode == "RGB" else image.convert("RGB")
+    return composite
+
+
+def composite_case():
+    """
+    The composite benchmark's inputs: the largest postcard at native
+    resolution with a long Latin letter laid out the way the generator page does.
+    """
+    postcards = postcard_core.get_postcard_pool().paths()
+    largest = max(postcards, key=os.path.getsize)
+    background = load_background(largest)
+    width, height = background.size
+    font_path = postcard_core.get_font_files()[0]
+    origin = (int(width * 0.03), int(height * 0.18))
+    layout = postcard_core.get_layout_engine().fit(
+        SAMPLE_LETTERS["latin"], font_path, (int(width * 0.42), int(height * 0.79)), 8, int(height * 0.075)
+    )
+    font = postcard_core.get_font_registry().get(font_path, layout.font_size)
+    return largest, background, layout, font, origin
+
+
+# Each approach runs up to the frame handed to the encoder, as the render path does
+COMPOSITE_APPROACHES = {
+    "full_frame": encoder_frame(composite_full_frame),
+    "tight": encoder_frame(draw_layout),  # shared background: RGB copy, text region blended
+    "tight_in_place": encoder_frame(functools.partial(draw_layout, copy_background=False)),  # owned background
+}
+
+
+def _proc_status_mb(field):
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    raise OSError(field)
+
+
+def composite_peak_mb(name, iterations):
+    """
+    Peak resident memory (MB) added by running one composite approach, measured
+    from /proc in this process: the peak is reset after setup, so the delta
+    covers only the buffers the approach allocates. Pillow allocates outside
+    the Python heap, which is why tracemalloc cannot see them. None without /proc.
+    """
+    _, background, layout, font, origin = composite_case()
+    fn = COMPOSITE_APPROACHES[name]
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")  # reset VmHWM to the current RSS
+        before = _proc_status_mb("VmRSS")
+        for _ in range(iterations):
+            fn(background, layout, font, origin, (40, 40, 40, 255))
+        return round(_proc_status_mb("VmHWM") - before, 1)
+    except OSError:
+        return None
+
+
+def measure_composite_peak_mb(name, iterations):
+    """
+    Run composite_peak_mb in a fresh interpreter so earlier benchmarks do not
+    mask the peak. A fixed mmap threshold makes glibc return each frame-sized
+    buffer to the OS on free instead of recycling it unseen.
+    """
+    env = dict(os.environ, MALLOC_MMAP_THRESHOLD_="131072")
+    code = f"from benchmarks.run_benchmarks import composite_peak_mb; print(composite_peak_mb({name!r}, {iterations}))"
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, "-c", code], cwd=root, env=env, capture_output=True, text=True)
+    try:
+        return float(output.stdout.strip().splitlines()[-1])
+    except (IndexError, ValueError):
+        return None
+
+
+def bench_composite(iterations):
+    largest, background, layout, font, origin = composite_case()
+    width, height = background.size
+    results = {}
+    for name, fn in COMPOSITE_APPROACHES.items():
+        samples = []
+        start = time.perf_counter()
+        for _ in range(iterations):
+            timed(samples, fn, background, layout, font, origin, (40, 40, 40, 255))
+        stats = summarize(samples, time.perf_counter() - start)
+        stats["peak_extra_rss_mb"] = measure_composite_peak_mb(name, min(iterations, 5))
+        results[f"composite.{name}"] = stats
+    peaks = ", ".join(
+        f"{name} {'n/a' if stats['peak_extra_rss_mb'] is None else format(stats['peak_extra_rss_mb'], '.1f') + ' MB'}"
+        for name, stats in ((name[len('composite.'):], stats) for name, stats in results.items())
+    )
+    print(f"composite on {os.path.basename(largest)} ({width}x{height}, frame {width * height * 4 / 2**20:.1f} MB): "
+          f"measured peak RSS added: {peaks}")
+    return results
+
+
+BENCHMARKS = {
+    "render": bench_render,
+    "generation": bench_generation,
+    "conversation": bench_conversation,
+    "composite": bench_composite,
+}
+
+
+# --------------------------
+# BASELINE COMPARISON
+# --------------------------
+def compare(results, baseline, tolerance):
+    """
+    Print each metric next to its baseline; return the regressed metric names.
+    Only latency percentiles are compared (RSS and throughput are informational).
+    """
+    regressions = []
+    for name, stats in sorted(results.items()):
+        base = baseline.get(name)
+        line = f"{name:<28} p50 {stats['p50_ms']:8.2f} ms  p95 {stats['p95_ms']:8.2f} ms  p99 {stats['p99_ms']:8.2f} ms  " \
+               f"{stats['throughput_per_s']:8.1f}/s  rss {stats['peak_rss_mb']:6.1f} MB"
+        if base:
+            deltas = []
+            for key in ("p50_ms", "p95_ms"):
+                change = (stats[key] - base[key]) / base[key] if base[key] else 0.0
+                deltas.append(f"{key[:3]} {change:+.0%}")
+                if change > tolerance:
+                    regressions.append(f"{name}.{key}")
+            line += "  vs baseline: " + ", ".join(deltas)
+        else:
+            line += "  NO BASELINE"
+        print(line)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark rendering, generation and conversation turns.")
+    parser.add_argument("--only", default=",".join(BENCHMARKS), help="comma-separated subset of: " + ", ".join(BENCHMARKS))
+    parser.add_argument("--iterations", type=int, default=20, help="iterations per benchmark case (default: 20)")
+    parser.add_argument("--latency", type=float, default=0.3, help="fake server first-token latency in seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=60.0, help="fake server token rate")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before failing (default: 0.2)")
+    args = parser.parse_args(argv)
+
+    selected = [name.strip() for name in args.only.split(",") if name.strip()]
+    unknown = [name for name in selected if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+
+    results = {}
+    with FakeOpenAIServer(latency=args.latency, tokens_per_second=args.tokens_per_second) as server:
+        postcard_core.set_client(build_client(api_key="benchmark", base_url=server.base_url, warm_up=False))
+        for name in selected:
+            results.update(BENCHMARKS[name](args.iterations))
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    elif not args.save_baseline:
+        print(f"WARNING: no baseline at {args.baseline}; nothing is compared and regressions cannot fail this run. "
+              f"Record one with --save-baseline.", file=sys.stderr)
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(dict(baseline, **results), f, indent=4, sort_keys=True)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+    if regressions:
+        print("Regressions: " + ", ".join(regressions))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
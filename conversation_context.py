@@ -0,0 +1,94 @@
+# --------------------------
+# BOUNDED CONVERSATION CONTEXT
+# --------------------------
+# Conversation mode used to send the whole history on every turn. Instead,
+# the prompt is built from the system message, a rolling summary of older
+# turns and the most recent turns verbatim, capped by a token budget. The
+# summary is refreshed in the background, so a turn never waits for it.
+
+KEEP_LAST_MESSAGES = 6      # recent user/assistant messages sent verbatim
+MIN_FOLD_MESSAGES = 4       # fold older messages into the summary in batches of at least this size
+TOKEN_BUDGET = 1500         # prompt tokens for summary + recent messages
+SUMMARY_MAX_TOKENS = 200
+
+SUMMARY_SYSTEM_PROMPT = (
+    "You maintain a running summary of a language-practice chat between two friends. "
+    "Keep names, facts shared, questions asked and open topics. Write at most 120 words."
+)
+
+
+def estimate_tokens(text):
+    """
+    Rough token count (about 4 characters per token plus message overhead).
+    Good enough for budgeting without a tokenizer dependency.
+    """
+    return len(text) // 4 + 4
+
+
+def split_history(history):
+    """
+    Separate the leading system prompt from the user/assistant turns.
+    """
+    system = [msg for msg in history[:1] if msg["role"] == "system"]
+    return system, history[len(system):]
+
+
+def build_context_messages(history, summary_text="", summarized_count=0,
+                           token_budget=TOKEN_BUDGET):
+    """
+    Prompt messages for the next reply: the system prompt, the rolling
+    summary (if any) and every turn not yet summarized. If those turns still
+    exceed token_budget (the summary is lagging), the oldest are dropped;
+    the latest turn is always kept.
+    """
+    system, turns = split_history(history)
+    recent = turns[summarized_count:]
+
+    budget = token_budget - (estimate_tokens(summary_text) if summary_text else 0)
+    kept = []
+    for msg in reversed(recent):
+        cost = estimate_tokens(msg["content"])
+        if kept and cost > budget:
+            break
+        kept.append(msg)
+        budget -= cost
+    kept.reverse()
+
+    messages = list(system)
+    if summary_text:
+        messages.append({"role": "system", "content": f"Summary of the conversation so far: {summary_text}"})
+    # History entries may carry extra keys (e.g. stored translations) the API rejects
+    return messages + [{"role": msg["role"], "content": msg["content"]} for msg in kept]
+
+
+def turns_to_summarize(history, summarized_count=0, keep_last=KEEP_LAST_MESSAGES,
+                       min_batch=MIN_FOLD_MESSAGES):
+    """
+    Turns that have fallen out of the verbatim window and are not yet in the
+    summary. Returns an empty list until at least min_batch are pending.
+    """
+    _, turns = split_history(history)
+    pending = turns[summarized_count:max(summarized_count, len(turns) - keep_last)]
+    return pending if len(pending) >= min_batch else []
+
+
+def summarize_turns(complete, summary_text, turns, model="gpt-4o-mini"):
+    """
+    Fold turns into summary_text with one chat completion and return the new
+    summary. complete is a chat_completion-style callable returning text.
+    """
+    transcript = "\n".join(f"{msg['role']}: {msg['content']}" for msg in turns)
+    prompt = (
+        f"Current summary:\n{summary_text or '(empty)'}\n\n"
+        f"New messages:\n{transcript}\n\n"
+        "Return the updated summary."
+    )
+    return complete(
+        model=model,
+        messages=[
+            {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ],
+        max_tokens=SUMMARY_MAX_TOKENS,
+        temperature=0.3
+    )
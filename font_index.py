@@ -0,0 +1,186 @@
+import bisect
+import struct
+
+# --------------------------
+# FONT COVERAGE INDEX
+# --------------------------
+# Which codepoints each font in Fonts/ can draw, read straight from the
+# fonts' cmap tables (no glyphs are loaded, so the 4 MB CJK font costs a
+# few kilobytes of reading). The ranges are stored in the asset manifest
+# and re-read per font only when a file's size or mtime changes. Font
+# choice then follows the letter's actual characters instead of the target
+# language's name.
+
+
+# --------------------------
+# CMAP PARSING
+# --------------------------
+def _read_table_directory(f):
+    """
+    Map of table tag -> (offset, length) for a TrueType/OpenType file
+    (the first font of a collection).
+    """
+    header = f.read(12)
+    if header[:4] == b"ttcf":
+        # Collection header: tag, version, numFonts, then one offset per font
+        first_offset = struct.unpack(">I", f.read(4))[0]
+        f.seek(first_offset)
+        header = f.read(12)
+    num_tables = struct.unpack(">H", header[4:6])[0]
+    tables = {}
+    for _ in range(num_tables):
+        tag, _, offset, length = struct.unpack(">4sIII", f.read(16))
+        tables[tag] = (offset, length)
+    return tables
+
+
+def _format4_ranges(data, offset):
+    seg_count = struct.unpack_from(">H", data, offset + 6)[0] // 2
+    ends_at = offset + 14
+    starts_at = ends_at + seg_count * 2 + 2
+    deltas_at = starts_at + seg_count * 2
+    range_offsets_at = deltas_at + seg_count * 2
+    ranges = []
+    for i in range(seg_count):
+        end = struct.unpack_from(">H", data, ends_at + i * 2)[0]
+        start = struct.unpack_from(">H", data, starts_at + i * 2)[0]
+        delta = struct.unpack_from(">h", data, deltas_at + i * 2)[0]
+        range_offset = struct.unpack_from(">H", data, range_offsets_at + i * 2)[0]
+        if start > end or start == 0xFFFF:
+            continue
+        if range_offset == 0:
+            ranges.extend((c, c) for c in range(start, end + 1) if (c + delta) & 0xFFFF)
+            continue
+        # Glyph ids come from glyphIdArray; codepoints mapped to glyph 0 are missing
+        for c in range(start, end + 1):
+            glyph_at = range_offsets_at + i * 2 + range_offset + (c - start) * 2
+            if glyph_at + 2 <= len(data) and struct.unpack_from(">H", data, glyph_at)[0]:
+                ranges.append((c, c))
+    return ranges
+
+
+def _format12_ranges(data, offset):
+    num_groups = struct.unpack_from(">I", data, offset + 12)[0]
+    ranges = []
+    for i in range(num_groups):
+        start, end, start_glyph = struct.unpack_from(">III", data, offset + 16 + i * 12)
+        if start_glyph == 0:
+            start += 1  # the first codepoint maps to .notdef
+        if start <= end:
+            ranges.append((start, end))
+    return ranges
+
+
+def _merge_ranges(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def read_cmap_ranges(font_path):
+    """
+    Sorted, merged [start, end] codepoint ranges the font maps to a glyph.
+    Uses the full-Unicode (format 12) subtable when present, otherwise the
+    BMP (format 4) one. Raises OSError for unreadable or unsupported files.
+    """
+    with open(font_path, "rb") as f:
+        try:
+            tables = _read_table_directory(f)
+        except struct.error:
+            raise OSError(f"Not a TrueType/OpenType font: {font_path}")
+        if b"cmap" not in tables:
+            raise OSError(f"No cmap table in {font_path}")
+        offset, length = tables[b"cmap"]
+        f.seek(offset)
+        data = f.read(length)
+
+    num_subtables = struct.unpack_from(">H", data, 2)[0]
+    subtables = {}
+    for i in range(num_subtables):
+        platform_id, encoding_id, sub_offset = struct.unpack_from(">HHI", data, 4 + i * 8)
+        if (platform_id, encoding_id) in ((3, 10), (0, 4), (0, 6), (3, 1), (0, 3), (0, 1), (0, 0)):
+            sub_format = struct.unpack_from(">H", data, sub_offset)[0]
+            subtables.setdefault(sub_format, sub_offset)
+    if 12 in subtables:
+        return _merge_ranges(_format12_ranges(data, subtables[12]))
+    if 4 in subtables:
+        return _merge_ranges(_format4_ranges(data, subtables[4]))
+    raise OSError(f"No Unicode cmap subtable in {font_path}")
+
+
+# --------------------------
+# INDEX
+# --------------------------
+class FontCoverageIndex:
+    """
+    Codepoint coverage and file size of a set of fonts, answering which
+    fonts can draw a text. Read-only after construction.
+    """
+
+    def __init__(self, fonts):
+        # fonts: {font path: {"size", "ranges"}}, e.g. AssetManifest.font() entries;
+        # fonts without a readable cmap are never offered
+        self._fonts = {path: entry for path, entry in fonts.items() if entry and entry["ranges"]}
+        self._starts = {path: [r[0] for r in entry["ranges"]] for path, entry in self._fonts.items()}
+
+    def font_paths(self):
+        return list(self._fonts)
+
+    def file_size(self, font_path):
+        entry = self._fonts.get(font_path)
+        return entry["size"] if entry else 0
+
+    def covers(self, font_path, char):
+        """
+        True if font_path has a glyph for char (a one-character string).
+        Unindexed fonts (and None, Pillow's default font) are assumed to cover it.
+        """
+        entry = self._fonts.get(font_path)
+        if entry is None:
+            return True
+        codepoint = ord(char)
+        i = bisect.bisect_right(self._starts[font_path], codepoint) - 1
+        return i >= 0 and codepoint <= entry["ranges"][i][1]
+
+    def missing(self, font_path, text):
+        """
+        Set of characters in text (ignoring whitespace) that font_path cannot draw.
+        """
+        return {char for char in set(text) if not char.isspace() and not self.covers(font_path, char)}
+
+    def choose(self, text, candidates=None, rng=None):
+        """
+        Font chain for text: a primary font followed by fallbacks, as a tuple.
+
+        The primary font is the first candidate, in an order shuffled by rng
+        (if given), that draws every character, so a growing text keeps its
+        font for as long as that font still covers it. If none does, the indexed font
+        covering the most characters (cheapest on ties) is used. Fallbacks
+        are then added cheapest-first, each covering some of what is still
+        missing, so heavy fonts are only pulled in for characters that need them.
+        """
+        candidates = [path for path in (candidates or self.font_paths()) if path in self._fonts]
+        if not candidates:
+            return (None,)
+        if rng is not None:
+            rng.shuffle(candidates)
+        for path in candidates:
+            if not self.missing(path, text):
+                return (path,)
+
+        by_cost = sorted(self.font_paths(), key=self.file_size)
+        primary = min(by_cost, key=lambda path: len(self.missing(path, text)))
+        chain = [primary]
+        remaining = self.missing(primary, text)
+        for path in by_cost:
+            if not remaining:
+                break
+            still_missing = {char for char in remaining if not self.covers(path, char)}
+            if len(still_missing) < len(remaining):
+                chain.append(path)
+                remaining = still_missing
+        return tuple(chain)
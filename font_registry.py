@@ -0,0 +1,150 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# --------------------------
+# FONT REGISTRY
+# --------------------------
+# Loaded FreeTypeFont objects are kept per (path, size) so a render never
+# re-parses a TTF once the registry is warm. The registry is meant to be
+# created once per process (see get_font_registry() in the entry points)
+# and shared by every session and rerun.
+
+REFERENCE_CHAR = "A"
+REFERENCE_SIZE = 14
+DEFAULT_MAX_BYTES = 48 * 1024 * 1024  # 48 MB of font faces
+
+
+def _bbox_size(font, text):
+    """
+    Width/height of text rendered with font (getsize() was removed in Pillow 10).
+    """
+    try:
+        return font.getsize(text)
+    except AttributeError:
+        bbox = font.getbbox(text)
+        return (bbox[2] - bbox[0], bbox[3] - bbox[1])
+
+
+class FontRegistry:
+    """
+    Thread-safe LRU cache of FreeTypeFont objects keyed by (font_path, size).
+
+    Each entry is charged roughly the size of its TTF file against max_bytes,
+    since FreeType keeps one face per (file, size). The reference "A" height
+    of every font is measured once and kept for the lifetime of the registry,
+    so size adjustments never reload a font.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._fonts = OrderedDict()   # (path, size) -> (font, cost)
+        self._ref_heights = {}        # path -> height of "A" at REFERENCE_SIZE
+        self._char_sizes = {}         # (path, size) -> size of "A"
+        self._file_sizes = {}         # path -> bytes on disk
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.on_load = None  # optional callback(font_path, size, seconds) after a font is parsed
+
+    def get(self, font_path, size):
+        """
+        Return the FreeTypeFont for (font_path, size), loading it on first use.
+        A font_path of None gives Pillow's built-in default font at that size.
+        Raises OSError if the font cannot be loaded.
+        """
+        key = (font_path, int(size))
+        with self._lock:
+            entry = self._fonts.get(key)
+            if entry is not None:
+                self._fonts.move_to_end(key)
+                return entry[0]
+
+        # Parse outside the lock so one slow CJK font does not block other renders
+        from PIL import ImageFont  # Pillow is imported on first use, not at startup
+
+        start = time.perf_counter()
+        if font_path is None:
+            font = ImageFont.load_default(key[1])
+        else:
+            font = ImageFont.truetype(font_path, key[1])
+        if self.on_load is not None:
+            self.on_load(font_path, key[1], time.perf_counter() - start)
+        cost = self._file_size(font_path)
+
+        with self._lock:
+            entry = self._fonts.get(key)
+            if entry is not None:
+                self._fonts.move_to_end(key)
+                return entry[0]
+            self._fonts[key] = (font, cost)
+            self._bytes += cost
+            self._evict()
+        return font
+
+    def char_size(self, font_path, size, char=REFERENCE_CHAR):
+        """
+        Cached (width, height) of char rendered at font_path/size.
+        """
+        key = (font_path, int(size), char)
+        with self._lock:
+            cached = self._char_sizes.get(key)
+        if cached is None:
+            cached = _bbox_size(self.get(font_path, size), char)
+            with self._lock:
+                self._char_sizes[key] = cached
+        return cached
+
+    def size_for_char_height(self, font_path, target_char_height):
+        """
+        Font size at which REFERENCE_CHAR is about target_char_height pixels tall.
+        The reference height is measured once per font.
+        """
+        with self._lock:
+            ref_height = self._ref_heights.get(font_path)
+        if ref_height is None:
+            ref_height = self.char_size(font_path, REFERENCE_SIZE)[1]
+            with self._lock:
+                self._ref_heights[font_path] = ref_height
+        if ref_height <= 0:
+            return REFERENCE_SIZE
+        return int(REFERENCE_SIZE * target_char_height / ref_height)
+
+    def warm_up(self, font_paths, sizes=()):
+        """
+        Measure reference heights (and optionally load given sizes) ahead of
+        the first render. Fonts that fail to load are skipped.
+        """
+        for font_path in font_paths:
+            try:
+                self.size_for_char_height(font_path, REFERENCE_SIZE)
+                for size in sizes:
+                    self.get(font_path, size)
+            except OSError:
+                continue
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._fonts),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "measured_fonts": len(self._ref_heights),
+            }
+
+    def _file_size(self, font_path):
+        size = self._file_sizes.get(font_path)
+        if size is None and font_path is not None:
+            try:
+                size = os.path.getsize(font_path)
+            except OSError:
+                size = 0
+            self._file_sizes[font_path] = size
+        return size or 0
+
+    def _evict(self):
+        # Always keep the most recently used face, even if it alone exceeds the budget
+        # Measurements are tiny and stay cached after their face is evicted.
+        while self._bytes > self.max_bytes and len(self._fonts) > 1:
+            _, (_, cost) = self._fonts.popitem(last=False)
+            self._bytes -= cost
@@ -0,0 +1,253 @@
+import hashlib
+import io
+import json
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+# --------------------------
+# RENDER STORE
+# --------------------------
+# Finished postcards are encoded once per resolution tier and kept in a
+# store shared by every session, keyed by a hash of what was rendered
+# (postcard, text, font, color, tier). Sessions keep only that key, so
+# per-session memory is a short string and rendering an identical card
+# again is a lookup. Entries evicted from the in-memory LRU are spilled to
+# disk and read back on the next hit.
+#
+# Tiers: a small, quickly drawn preview; the display size, picked from the
+# device type in the User-Agent; and a print-quality PNG at the postcard's
+# full resolution, only drawn when the learner asks to download it. All
+# tiers draw the same layout, scaled.
+#
+# st.image passes JPEG and PNG bytes through untouched as long as they are no
+# wider than its maximum content width; any other format (WebP included) or a
+# wider image is decoded and re-encoded on every call. Preview and display
+# tiers are therefore JPEG, at most that wide.
+
+DISPLAY_QUALITY = int(os.environ.get("POSTCARD_IMAGE_QUALITY", "85"))
+DISPLAY_MAX_WIDTH = 1460  # st.image's MAXIMUM_CONTENT_WIDTH
+OFFER_PNG_DOWNLOAD = os.environ.get("POSTCARD_PNG_DOWNLOAD", "1") != "0"
+DEFAULT_MAX_BYTES = 128 * 1024 * 1024
+DEFAULT_SPILL_DIR = os.environ.get("POSTCARD_RENDER_SPILL_DIR", ".cache/renders")  # "" disables spilling
+DEFAULT_MAX_SPILL_BYTES = 1024 * 1024 * 1024
+
+PREVIEW_WIDTH = 360
+PREVIEW_QUALITY = 60
+# Display widths in device pixels; a browser gets the smallest one covering its container
+DISPLAY_WIDTHS = (480, 720, 1080, DISPLAY_MAX_WIDTH)
+CONTAINER_MAX_WIDTH = 704   # CSS pixels of content in Streamlit's centered layout
+MOBILE_CONTENT_WIDTH = 400  # CSS pixels of content on a typical phone
+# Pixel ratio assumed for every screen: most phones and many laptops are 2x,
+# and sharper than that is not worth the bytes on a postcard
+ASSUMED_PIXEL_RATIO = float(os.environ.get("POSTCARD_DISPLAY_PIXEL_RATIO", "2"))
+
+# width None renders at the postcard's full (print) resolution
+RenderTier = namedtuple("RenderTier", ["name", "width", "image_format", "quality"])
+PREVIEW_TIER = RenderTier("preview", PREVIEW_WIDTH, "jpeg", PREVIEW_QUALITY)
+PRINT_TIER = RenderTier("print", None, "png", None)
+
+EncodedImage = namedtuple("EncodedImage", ["data", "image_format"])
+_EXTENSIONS = {"jpeg": ".jpg", "png": ".png"}
+
+
+def display_tier(width=CONTAINER_MAX_WIDTH):
+    """
+    JPEG tier at the smallest of DISPLAY_WIDTHS that is at least width device pixels.
+    """
+    width = next((candidate for candidate in DISPLAY_WIDTHS if candidate >= width), DISPLAY_WIDTHS[-1])
+    return RenderTier("display", width, "jpeg", DISPLAY_QUALITY)
+
+
+def display_width_for(headers):
+    """
+    Device pixels the postcard needs in the browser that sent headers
+    (e.g. st.context.headers), guessed from the User-Agent alone: a phone's
+    or a desktop's content width at ASSUMED_PIXEL_RATIO.
+
+    The real viewport width and pixel ratio only arrive as client hints
+    after the server opts in with an Accept-CH header, which Streamlit never
+    sends, so a 1x desktop gets the same (sharper than needed) card as a 2x one.
+    """
+    css_width = MOBILE_CONTENT_WIDTH if "Mobi" in (headers.get("User-Agent") or "") else CONTAINER_MAX_WIDTH
+    return int(css_width * ASSUMED_PIXEL_RATIO)
+
+
+def encode_image(image, image_format="jpeg", quality=DISPLAY_QUALITY):
+    """
+    Encode a PIL image to JPEG or PNG bytes. The (fully opaque) alpha channel
+    is dropped; PNG uses light compression since it is lossless either way.
+    """
+    buffer = io.BytesIO()
+    if image.mode != "RGB":
+        image = image.convert("RGB")  # an RGB image is encoded as is, not copied first
+    if image_format == "png":
+        image.save(buffer, format="PNG", compress_level=1)
+    else:
+        image.save(buffer, format="JPEG", quality=quality, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def encode_tier(image, tier):
+    """
+    EncodedImage of image in tier's format and quality.
+    """
+    return EncodedImage(encode_image(image, tier.image_format, tier.quality or DISPLAY_QUALITY), tier.image_format)
+
+
+def render_key(*parts):
+    """
+    Stable hex key for the inputs of a render (any JSON-serializable values).
+    """
+    payload = json.dumps(parts, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RenderStore:
+    """
+    Thread-safe LRU of EncodedImage entries by render key, bounded by
+    max_bytes in memory and max_spill_bytes on disk (spill_dir=None keeps
+    everything in memory and simply drops evicted entries).
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, spill_dir=DEFAULT_SPILL_DIR,
+                 max_spill_bytes=DEFAULT_MAX_SPILL_BYTES):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir or None
+        self.max_spill_bytes = max_spill_bytes
+        self._entries = OrderedDict()  # key -> EncodedImage
+        self._bytes = 0
+        self._spilled = OrderedDict()  # key -> bytes on disk, oldest first
+        self._spill_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if self.spill_dir:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            self._scan_spill_dir()
+
+    def get(self, key):
+        """
+        The EncodedImage stored under key, or None. Spilled entries are
+        read back from disk and moved into memory.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            spilled = key in self._spilled
+        entry = self._read_spilled(key) if spilled else None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self._insert(key, entry)
+        return entry
+
+    def put(self, key, encoded):
+        self._insert(key, encoded)
+        return encoded
+
+    def get_or_render(self, key, render):
+        """
+        The entry for key, calling render() for an EncodedImage only if the
+        store does not have it yet.
+        """
+        entry = self.get(key)
+        if entry is None:
+            entry = self.put(key, render())
+        return entry
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "spilled_entries": len(self._spilled),
+                "spilled_bytes": self._spill_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _insert(self, key, encoded):
+        evicted = []
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = encoded
+            self._bytes += _entry_size(encoded)
+            # Always keep the newest entry, even if it alone exceeds the budget
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                old_key, old_entry = self._entries.popitem(last=False)
+                self._bytes -= _entry_size(old_entry)
+                evicted.append((old_key, old_entry))
+        # Disk writes happen outside the lock so lookups never wait on I/O
+        for old_key, old_entry in evicted:
+            self._spill(old_key, old_entry)
+
+    def _paths(self, key):
+        return [os.path.join(self.spill_dir, key + extension) for extension in _EXTENSIONS.values()]
+
+    def _spill(self, key, encoded):
+        if not self.spill_dir:
+            return
+        with self._lock:
+            if key in self._spilled:
+                return
+        path = os.path.join(self.spill_dir, key + _EXTENSIONS[encoded.image_format])
+        size = len(encoded.data)
+        try:
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(encoded.data)
+            os.replace(tmp_path, path)
+        except OSError:
+            return  # disk full or read-only: the entry is simply dropped
+        with self._lock:
+            self._spilled[key] = size
+            self._spill_bytes += size
+            stale = []
+            while self._spill_bytes > self.max_spill_bytes and len(self._spilled) > 1:
+                old_key, old_size = self._spilled.popitem(last=False)
+                self._spill_bytes -= old_size
+                stale.append(old_key)
+        for old_key in stale:
+            for path in self._paths(old_key):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _read_spilled(self, key):
+        for image_format, extension in _EXTENSIONS.items():
+            try:
+                with open(os.path.join(self.spill_dir, key + extension), "rb") as f:
+                    return EncodedImage(f.read(), image_format)
+            except OSError:
+                continue
+        with self._lock:
+            self._spill_bytes -= self._spilled.pop(key, 0)
+        return None
+
+    def _scan_spill_dir(self):
+        # Renders spilled by earlier runs stay usable, oldest evicted first
+        sizes, mtimes = {}, {}
+        for entry in os.scandir(self.spill_dir):
+            key, ext = os.path.splitext(entry.name)
+            if ext not in _EXTENSIONS.values() or not entry.is_file():
+                continue
+            stat = entry.stat()
+            sizes[key] = sizes.get(key, 0) + stat.st_size
+            mtimes[key] = max(mtimes.get(key, 0), stat.st_mtime)
+        for key in sorted(sizes, key=mtimes.get):
+            self._spilled[key] = sizes[key]
+            self._spill_bytes += sizes[key]
+
+
+def _entry_size(encoded):
+    return len(encoded.data)
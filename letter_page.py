@@ -0,0 +1,285 @@
+import os
+import random
+import functools
+
+import streamlit as st
+
+from image_store import OFFER_PNG_DOWNLOAD, PREVIEW_TIER, PRINT_TIER, display_tier, display_width_for
+from letter_prefetch import LetterPrefetcher
+from request_scheduler import PRIORITY_BACKGROUND, PRIORITY_PREFETCH, request_priority, run_with_priority
+from postcard_core import (
+    COMBINED_GENERATION,
+    POSTCARD_FOLDER,
+    correct_text_in_target_language,
+    generate_friend_letter,
+    generate_letter_bundle,
+    get_background_executor,
+    get_metrics,
+    get_render_store,
+    pick_random_postcard,
+    preview_postcard,
+    render_postcard,
+    render_postcard_tiers,
+    translate_to_language,
+)
+
+# --------------------------
+# LETTER PAGE FLOW
+# --------------------------
+# The "Generate Letter" section both pages show: a prefetched or freshly
+# generated letter on a postcard, the optional print-quality download, the
+# translation reveal and the reply correction. Each page passes its own
+# Prompts and PostcardStyle; everything else is the same on both.
+
+# Number of ready-made letters kept per learner profile (0 disables prefetching)
+PREFETCH_DEPTH = int(os.environ.get("POSTCARD_PREFETCH_DEPTH", "2"))
+
+# Characters after which a progressive postcard preview is redrawn
+SENTENCE_ENDINGS = (".", "!", "?", "\n", "。", "！", "？")
+
+def stream_letter_with_preview(letter_chunks, render_preview):
+    """
+    Consume a streamed letter, calling render_preview(text_so_far) each time a
+    sentence is completed. Returns the full, stripped letter text.
+    """
+    letter_text = ""
+    for chunk in letter_chunks:
+        letter_text += chunk
+        if any(ending in chunk for ending in SENTENCE_ENDINGS):
+            render_preview(letter_text)
+    return letter_text.strip()
+
+def build_letter_bundle(profile, prompts, style):
+    """
+    Produce a ready-to-show letter for a prefetch profile. Runs on a prefetch
+    worker thread, so it only uses the plain helpers (no st.* calls).
+    """
+    friend_name, user_name, target_language, language_level, mother_tongue, display_width = profile
+    postcard_path = pick_random_postcard()
+    if not postcard_path:
+        raise FileNotFoundError(f"No postcard images found in {POSTCARD_FOLDER}")
+    # Nobody is waiting for a prefetched letter yet: its API calls queue behind interactive ones.
+    # Letter, translation and vocabulary come from one request when possible.
+    with request_priority(PRIORITY_PREFETCH):
+        letter = generate_letter_bundle(friend_name, user_name, target_language, mother_tongue, prompts=prompts)
+    letter_text = letter.letter
+    # Rendered and encoded here, on the prefetch thread, at the display width of
+    # the browser that asked for it; the bundle only carries the store key
+    style_seed = random.getrandbits(32)
+    tier = display_tier(display_width)
+    final_postcard = render_postcard(postcard_path, letter_text, target_language, style_seed, tier, style)
+    return {
+        "postcard_path": postcard_path,
+        "letter_text": letter_text,
+        "final_postcard": final_postcard,
+        "final_postcard_width": tier.width,
+        "style_seed": style_seed,
+        "letter_translation": letter.translation,
+        "letter_vocabulary": letter.vocabulary,
+    }
+
+@st.cache_resource(show_spinner=False)
+def get_letter_prefetcher(prompts, style):
+    """
+    Process-wide queues of prefetched letter bundles, keyed by learner profile,
+    one set per page wording and card look.
+    """
+    return LetterPrefetcher(functools.partial(build_letter_bundle, prompts=prompts, style=style), depth=PREFETCH_DEPTH)
+
+def get_letter_translation():
+    """
+    Return the letter translation, waiting for the background request if it
+    is still in flight. Returns None if no letter has been generated.
+    """
+    future = st.session_state.pop("letter_translation_future", None)
+    if future is not None:
+        with get_metrics().timed("flow.translation_wait"):
+            st.session_state["letter_translation"] = future.result()
+    return st.session_state.get("letter_translation")
+
+def vocabulary_toggle():
+    """
+    Sidebar choice between one request for letter, translation and key
+    vocabulary (no streamed preview) and a streamed letter whose translation
+    is requested separately (no vocabulary). False when the combined request
+    is disabled.
+    """
+    return COMBINED_GENERATION and st.sidebar.toggle(
+        "📚 Key vocabulary with each letter", value=False,
+        help="The letter arrives in one piece with its translation and key words instead of being streamed."
+    )
+
+def render_debug_panel():
+    """
+    Show per-stage latencies and LLM token/cache totals for this server
+    process in the sidebar, when the debug toggle is on.
+    """
+    if not st.sidebar.toggle("🛠️ Debug metrics"):
+        return
+    stages, llm_calls = get_metrics().summary()
+    st.sidebar.caption("Stage latencies (ms, recent samples)")
+    st.sidebar.dataframe(stages, hide_index=True)
+    st.sidebar.caption("LLM calls")
+    st.sidebar.dataframe(llm_calls, hide_index=True)
+
+def generate_letter(friend_name, user_name, target_language, mother_tongue, card_tier, prompts, style, with_vocabulary):
+    """
+    Generate a letter on the script thread and render it into the render
+    store, streaming a postcard preview unless the vocabulary is requested.
+    """
+    style_seed = random.getrandbits(32)
+    preview = st.empty()
+    if with_vocabulary:
+        # 1) Letter, translation and key vocabulary in one request: nothing to stream
+        letter = generate_letter_bundle(friend_name, user_name, target_language, mother_tongue, prompts=prompts)
+        letter_text = letter.letter
+        st.session_state["letter_text"] = letter_text
+        st.session_state.pop("letter_translation_future", None)
+        st.session_state["letter_translation"] = letter.translation
+        st.session_state["letter_vocabulary"] = letter.vocabulary
+    else:
+        # 1) Stream a short letter in the target language, redrawing a low-resolution
+        #    preview of the postcard at each sentence boundary (same font/color throughout)
+        letter_text = stream_letter_with_preview(
+            generate_friend_letter(friend_name, user_name, target_language, stream=True, prompts=prompts),
+            lambda partial: preview.image(
+                preview_postcard(st.session_state["postcard_path"], partial, target_language, style_seed, style),
+                use_container_width=True
+            )
+        )
+        st.session_state["letter_text"] = letter_text
+
+        # 2) Start the translation (target language -> mother tongue) in the background
+        #    so it overlaps with rendering; it is collected on reveal
+        st.session_state.pop("letter_translation", None)
+        st.session_state.pop("letter_vocabulary", None)
+        st.session_state["letter_translation_future"] = get_background_executor().submit(
+            run_with_priority, PRIORITY_BACKGROUND, translate_to_language, letter_text, mother_tongue, prompts
+        )
+
+    # 3) Create the final postcard in the shared render store: the finished
+    #    letter's preview stays up while the display size is drawn; the
+    #    session keeps only the keys
+    st.session_state["postcard_style_seed"] = style_seed
+    st.session_state.pop("print_postcard", None)
+    tier_keys = render_postcard_tiers(
+        st.session_state["postcard_path"], letter_text, target_language, style_seed,
+        [PREVIEW_TIER, card_tier], style
+    )
+    preview.image(get_render_store().get(next(tier_keys)).data, use_container_width=True)
+    st.session_state["final_postcard"] = next(tier_keys)
+    st.session_state["final_postcard_width"] = card_tier.width
+    preview.empty()
+
+def letter_section(friend_name, user_name, target_language, language_level, mother_tongue, prompts, style,
+                   with_vocabulary=False):
+    """
+    Draw the Generate Letter section: the button, the postcard sized for this
+    browser, the print download, the translation reveal and the reply correction.
+    """
+    # Size the postcard for this browser's container instead of sending one size to every device
+    card_tier = display_tier(display_width_for(st.context.headers))
+
+    if "postcard_path" not in st.session_state:
+        st.session_state["postcard_path"] = pick_random_postcard()
+
+    # Keep a few letters prefetched for the current settings and display width;
+    # drop the old queue whenever the settings change.
+    letter_profile = (friend_name, user_name, target_language, language_level, mother_tongue, card_tier.width)
+    prefetcher = get_letter_prefetcher(prompts, style)
+    previous_profile = st.session_state.get("prefetch_profile")
+    if previous_profile is not None and previous_profile != letter_profile:
+        prefetcher.discard(previous_profile)
+    st.session_state["prefetch_profile"] = letter_profile
+    prefetcher.ensure(letter_profile)
+
+    if st.button("✉️ Generate Letter"):
+        # Click-to-card latency, by whether a prefetched letter was ready
+        with get_metrics().timed("flow.generate_letter") as flow:
+            bundle = prefetcher.take(letter_profile)
+            flow["prefetched"] = bundle is not None
+            if bundle is not None:
+                # A prefetched letter is ready: no API call or render on this click
+                st.session_state["postcard_path"] = bundle["postcard_path"]
+                st.session_state["letter_text"] = bundle["letter_text"]
+                st.session_state["final_postcard"] = bundle["final_postcard"]
+                st.session_state["final_postcard_width"] = bundle["final_postcard_width"]
+                st.session_state.pop("print_postcard", None)
+                st.session_state["postcard_style_seed"] = bundle["style_seed"]
+                st.session_state.pop("letter_translation_future", None)
+                st.session_state["letter_translation"] = bundle["letter_translation"]
+                if with_vocabulary:
+                    st.session_state["letter_vocabulary"] = bundle["letter_vocabulary"]
+                else:
+                    st.session_state.pop("letter_vocabulary", None)
+                st.success("✅ Letter generated successfully!")
+            elif not st.session_state["postcard_path"]:
+                st.error("❌ No postcard images found. Please check your POSTCARD_FOLDER path.")
+            else:
+                with st.spinner("Generating your personalized letter..."):
+                    generate_letter(
+                        friend_name, user_name, target_language, mother_tongue, card_tier, prompts, style, with_vocabulary
+                    )
+                st.success("✅ Letter generated successfully!")
+
+    if "final_postcard" not in st.session_state:
+        return
+
+    card_inputs = (
+        st.session_state["postcard_path"], st.session_state["letter_text"],
+        target_language, st.session_state.get("postcard_style_seed")
+    )
+    final_postcard = None
+    if st.session_state.get("final_postcard_width") == card_tier.width:
+        final_postcard = get_render_store().get(st.session_state["final_postcard"])
+    if final_postcard is None:
+        # Prefetched at another width, or evicted from memory and disk: draw it for
+        # this browser (same postcard, text and seed give the same layout)
+        st.session_state["final_postcard"] = render_postcard(*card_inputs, card_tier, style)
+        st.session_state["final_postcard_width"] = card_tier.width
+        final_postcard = get_render_store().get(st.session_state["final_postcard"])
+    st.image(
+        final_postcard.data,
+        caption=f"✉️ Letter from {friend_name} to {user_name}",
+        use_container_width=True
+    )
+    if OFFER_PNG_DOWNLOAD:
+        # The native-resolution PNG is only drawn on request
+        print_postcard = None
+        if "print_postcard" in st.session_state:
+            print_postcard = get_render_store().get(st.session_state["print_postcard"])
+        if print_postcard is None and st.button("🖨️ Prepare Print-Quality Postcard"):
+            with st.spinner("Rendering your postcard at full resolution..."):
+                st.session_state["print_postcard"] = render_postcard(*card_inputs, PRINT_TIER, style)
+            print_postcard = get_render_store().get(st.session_state["print_postcard"])
+        if print_postcard is not None:
+            st.download_button("⬇️ Download Postcard (PNG)", print_postcard.data, file_name="postcard.png", mime="image/png")
+
+    st.subheader("🧐 Guess the Translation")
+    # Let user guess the translation in their native language
+    st.text_area(f"Your guess in {mother_tongue}:")
+
+    # Reveal actual translation
+    if st.button("🔍 Reveal ChatGPT Translation"):
+        letter_translation = get_letter_translation()
+        if letter_translation is not None:
+            st.write(letter_translation)
+            if st.session_state.get("letter_vocabulary"):
+                st.markdown("**📚 Key vocabulary**")
+                st.table(st.session_state["letter_vocabulary"])
+        else:
+            st.info("ℹ️ You have not generated a letter yet.")
+
+    # Reply to the letter in the target language
+    st.subheader(f"💬 Reply to the Letter in {target_language}")
+    user_reply = st.text_area(f"Write your reply in {target_language}:")
+
+    # Correct the user's reply in target_language
+    if st.button("✅ Correct My Reply"):
+        if user_reply.strip():
+            # Tokens are written as they arrive instead of behind a spinner
+            st.write_stream(correct_text_in_target_language(
+                user_reply, target_language, mother_tongue, stream=True, prompts=prompts
+            ))
+        else:
+            st.info("ℹ️ Please enter some text to correct.")
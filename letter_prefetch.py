@@ -0,0 +1,111 @@
+import logging
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+# --------------------------
+# LETTER PREFETCH POOL
+# --------------------------
+# Keeps a few ready-made letter bundles (letter, translation, rendered
+# postcard) per learner profile so "Generate Letter" can be served instantly.
+# Bundles are built by background workers with the same helpers the
+# interactive path uses; build_bundle must not touch st.* since it runs
+# outside the script thread.
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DEPTH = 2
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_PROFILES = 32
+
+
+class LetterPrefetcher:
+    """
+    Per-profile queues of prefetched bundles, refilled in the background.
+
+    A profile is any hashable tuple describing the learner settings a bundle
+    depends on. Discarding a profile drops its queue and any bundle still
+    being built for it.
+    """
+
+    def __init__(self, build_bundle, depth=DEFAULT_DEPTH, max_workers=DEFAULT_WORKERS,
+                 max_profiles=DEFAULT_MAX_PROFILES):
+        self.build_bundle = build_bundle
+        self.depth = depth
+        self.max_profiles = max_profiles
+        self.failures = 0
+        self._queues = OrderedDict()  # profile -> deque of bundles
+        self._in_flight = {}          # profile -> number of builds running
+        self._generations = {}        # profile -> bumped on discard
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="letter-prefetch")
+
+    def take(self, profile):
+        """
+        Pop a ready bundle for profile, or return None if none is ready.
+        Either way a refill is scheduled.
+        """
+        with self._lock:
+            queue = self._queues.get(profile)
+            bundle = queue.popleft() if queue else None
+        self.ensure(profile)
+        return bundle
+
+    def ensure(self, profile):
+        """
+        Schedule enough background builds to bring profile's queue up to depth.
+        """
+        if self.depth <= 0:
+            return
+        with self._lock:
+            queue = self._queues.setdefault(profile, deque())
+            self._queues.move_to_end(profile)
+            self._trim_profiles()
+            missing = self.depth - len(queue) - self._in_flight.get(profile, 0)
+            if missing <= 0:
+                return
+            self._in_flight[profile] = self._in_flight.get(profile, 0) + missing
+            generation = self._generations.get(profile, 0)
+        for _ in range(missing):
+            self._executor.submit(self._build, profile, generation)
+
+    def discard(self, profile):
+        """
+        Drop queued bundles for profile (e.g. after a settings change).
+        """
+        with self._lock:
+            self._queues.pop(profile, None)
+            self._generations[profile] = self._generations.get(profile, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "profiles": len(self._queues),
+                "ready": sum(len(q) for q in self._queues.values()),
+                "in_flight": sum(self._in_flight.values()),
+                "failures": self.failures,
+            }
+
+    def _build(self, profile, generation):
+        bundle = None
+        try:
+            bundle = self.build_bundle(profile)
+        except Exception:
+            logger.warning("Prefetching a letter failed for %r", profile, exc_info=True)
+            with self._lock:
+                self.failures += 1
+        with self._lock:
+            self._in_flight[profile] -= 1
+            if not self._in_flight[profile]:
+                del self._in_flight[profile]
+            # Settings changed while building: the bundle is stale
+            if bundle is None or self._generations.get(profile, 0) != generation:
+                return
+            queue = self._queues.get(profile)
+            if queue is not None and len(queue) < self.depth:
+                queue.append(bundle)
+
+    def _trim_profiles(self):
+        while len(self._queues) > self.max_profiles:
+            profile, _ = self._queues.popitem(last=False)
+            self._generations[profile] = self._generations.get(profile, 0) + 1
@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# --------------------------
+# PERSISTENT LLM RESPONSE CACHE
+# --------------------------
+# Chat completion replies are stored in a small SQLite database (WAL mode,
+# so several server processes can share it) keyed by a hash of the request.
+# Entries expire after a per-call TTL and the least recently used ones are
+# evicted once the stored text exceeds max_bytes.
+
+# POSTCARD_LLM_CACHE_PATH lets benchmarks and tests point at a throwaway database
+DEFAULT_CACHE_PATH = os.environ.get("POSTCARD_LLM_CACHE_PATH", os.path.join(".cache", "llm_responses.sqlite3"))
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024  # 32 MB of reply text
+
+# Only these request fields change the reply; anything else (stream, timeouts)
+# must not split the cache.
+KEY_FIELDS = ("model", "messages", "temperature", "max_tokens", "response_format")
+
+
+def make_cache_key(request):
+    """
+    Stable hash of the parts of a chat completion request that affect the reply.
+    """
+    payload = {field: request.get(field) for field in KEY_FIELDS}
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Disk-backed, size-bounded cache of chat completion replies.
+    Entries are shared through the database; hits and misses count this
+    instance's lookups only.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " content TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_access)")
+
+    def get(self, key):
+        """
+        Cached reply for key, or None if missing or expired.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[1] < now:
+                self.misses += 1
+                if row is not None:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, content, ttl):
+        """
+        Store content for key for ttl seconds, then evict down to max_bytes.
+        """
+        now = time.time()
+        size = len(content.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, content, size, expires_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, content, size, now + ttl, now),
+            )
+            self._evict(now)
+
+    def stats(self):
+        with self._lock:
+            entries, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": entries,
+                "bytes": total,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM responses WHERE expires_at < ?", (now,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Walk from the least recently used entry until enough bytes are freed
+        excess = total - self.max_bytes
+        stale_keys = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access"):
+            stale_keys.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", stale_keys)
@@ -0,0 +1,213 @@
+import bisect
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --------------------------
+# METRICS
+# --------------------------
+# Per-stage latency histograms, LLM token and cache counters, an optional
+# JSONL event log and a Prometheus text endpoint. Stages are dotted names
+# such as "llm.letter", "llm.first_token.conversation", "render.layout" or
+# "render.encode"; when the event log is on, every observation is also
+# appended to it with its labels (model, token counts, cache hit, ...).
+#
+# Creating a registry has no side effects: the endpoint only listens once
+# the app calls serve(), so the batch CLI and the benchmarks never bind it.
+
+# POSTCARD_METRICS_LOG=<path> turns the event log on (off by default); it is
+# rotated to <path>.1 whenever it reaches POSTCARD_METRICS_LOG_MAX_BYTES.
+# POSTCARD_METRICS_PORT=0 disables the endpoint.
+EVENT_LOG_PATH = os.environ.get("POSTCARD_METRICS_LOG", "")
+EVENT_LOG_MAX_BYTES = int(os.environ.get("POSTCARD_METRICS_LOG_MAX_BYTES", str(64 * 1024 * 1024)))
+METRICS_PORT = int(os.environ.get("POSTCARD_METRICS_PORT", "9464"))
+METRICS_HOST = "127.0.0.1"
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+RECENT_SAMPLES = 512  # per stage, for the percentiles in the debug panel
+
+
+class Metrics:
+    """
+    Stage histograms and recent samples, LLM call totals and the optional event log.
+    """
+
+    def __init__(self, event_log_path=EVENT_LOG_PATH, event_log_max_bytes=EVENT_LOG_MAX_BYTES):
+        self.event_log_path = event_log_path or None
+        self.event_log_max_bytes = event_log_max_bytes
+        self._histograms = {}  # stage -> count per bucket, the last one for +Inf
+        self._sums = defaultdict(float)
+        self._recent = defaultdict(lambda: deque(maxlen=RECENT_SAMPLES))
+        self._tokens = defaultdict(int)   # (stage, model, "prompt"/"completion") -> tokens
+        self._cache = defaultdict(int)    # (stage, "hit"/"miss") -> calls
+        self._lock = threading.Lock()
+        self._log_lock = threading.Lock()
+        self._log = None
+        self._log_size = 0
+        self._server = None
+        self._started = False
+        if self.event_log_path:
+            directory = os.path.dirname(self.event_log_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+    def observe(self, stage, seconds, **labels):
+        """
+        Record one duration for stage and log it as an event.
+        """
+        with self._lock:
+            counts = self._histograms.get(stage)
+            if counts is None:
+                counts = self._histograms[stage] = [0] * (len(BUCKETS) + 1)
+            counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+            self._sums[stage] += seconds
+            self._recent[stage].append(seconds)
+        self.event(stage, seconds=round(seconds, 6), **labels)
+
+    @contextmanager
+    def timed(self, stage, **labels):
+        """
+        Time the block as one observation of stage. The yielded dict can be
+        filled with extra labels for the event.
+        """
+        extra = {}
+        start = time.perf_counter()
+        try:
+            yield extra
+        finally:
+            self.observe(stage, time.perf_counter() - start, **labels, **extra)
+
+    def record_startup(self, import_seconds, first_paint_seconds):
+        """
+        Record a script run's import and first-paint times ("script.imports",
+        "script.first_paint"); the process's first run, the cold start, is
+        also recorded as "startup.imports" and "startup.first_paint".
+        """
+        self.observe("script.imports", import_seconds)
+        self.observe("script.first_paint", first_paint_seconds)
+        with self._lock:
+            cold, self._started = not self._started, True
+        if cold:
+            self.observe("startup.imports", import_seconds)
+            self.observe("startup.first_paint", first_paint_seconds)
+
+    def record_llm_call(self, stage, model, usage=None, cached=False):
+        """
+        Count a chat completion's tokens (from response.usage, if any) and cache outcome.
+        """
+        with self._lock:
+            self._cache[(stage, "hit" if cached else "miss")] += 1
+            if usage is not None:
+                self._tokens[(stage, model, "prompt")] += usage.prompt_tokens or 0
+                self._tokens[(stage, model, "completion")] += usage.completion_tokens or 0
+
+    def event(self, name, **fields):
+        """
+        Append one event to the event log, if it is on.
+        """
+        if not self.event_log_path:
+            return
+        line = json.dumps(dict(ts=round(time.time(), 3), event=name, **fields), ensure_ascii=False, default=str) + "\n"
+        with self._log_lock:
+            try:
+                if self._log is None:
+                    self._log = open(self.event_log_path, "a", encoding="utf-8", buffering=1)
+                    self._log_size = os.path.getsize(self.event_log_path)
+                self._log.write(line)
+                self._log_size += len(line.encode("utf-8"))
+                if self._log_size >= self.event_log_max_bytes:
+                    # Keep one previous file: the log never grows past twice the cap
+                    self._log.close()
+                    self._log = None
+                    os.replace(self.event_log_path, self.event_log_path + ".1")
+            except OSError:
+                self.event_log_path = None  # log not writable: stop logging, keep counting
+
+    def summary(self):
+        """
+        Per-stage count, mean, p50 and p95 (over recent samples, in ms), plus
+        token and cache totals per LLM stage; used by the debug panel.
+        """
+        with self._lock:
+            stages = []
+            for stage in sorted(self._histograms):
+                recent = sorted(self._recent[stage])
+                count = sum(self._histograms[stage])
+                stages.append({
+                    "stage": stage,
+                    "count": count,
+                    "mean_ms": round(self._sums[stage] / count * 1000, 1),
+                    "p50_ms": round(recent[len(recent) // 2] * 1000, 1),
+                    "p95_ms": round(recent[min(len(recent) - 1, int(len(recent) * 0.95))] * 1000, 1),
+                })
+            llm = defaultdict(lambda: {"prompt_tokens": 0, "completion_tokens": 0, "cache_hits": 0, "calls": 0})
+            for (stage, _, kind), tokens in self._tokens.items():
+                llm[stage][f"{kind}_tokens"] += tokens
+            for (stage, result), calls in self._cache.items():
+                llm[stage]["calls"] += calls
+                if result == "hit":
+                    llm[stage]["cache_hits"] += calls
+            return stages, [dict(stage=stage, **values) for stage, values in sorted(llm.items())]
+
+    def prometheus_text(self):
+        """
+        All metrics in the Prometheus text exposition format.
+        """
+        lines = [
+            "# HELP postcard_stage_seconds Duration of each pipeline stage.",
+            "# TYPE postcard_stage_seconds histogram",
+        ]
+        with self._lock:
+            for stage, counts in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ("+Inf",), counts):
+                    cumulative += count
+                    lines.append(f'postcard_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'postcard_stage_seconds_sum{{stage="{stage}"}} {self._sums[stage]:.6f}')
+                lines.append(f'postcard_stage_seconds_count{{stage="{stage}"}} {cumulative}')
+            lines += ["# HELP postcard_llm_tokens_total Tokens reported by the API.",
+                      "# TYPE postcard_llm_tokens_total counter"]
+            for (stage, model, kind), tokens in sorted(self._tokens.items()):
+                lines.append(f'postcard_llm_tokens_total{{stage="{stage}",model="{model}",kind="{kind}"}} {tokens}')
+            lines += ["# HELP postcard_llm_calls_total Chat completions by response cache outcome.",
+                      "# TYPE postcard_llm_calls_total counter"]
+            for (stage, result), calls in sorted(self._cache.items()):
+                lines.append(f'postcard_llm_calls_total{{stage="{stage}",cache="{result}"}} {calls}')
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port=METRICS_PORT, host=METRICS_HOST):
+        """
+        Serve /metrics on host:port from a daemon thread. Returns False if
+        disabled (port 0) or the port is taken (e.g. by another server process).
+        """
+        if not port or self._server is not None:
+            return self._server is not None
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self._server = ThreadingHTTPServer((host, port), Handler)
+        except OSError:
+            return False
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="postcard-metrics", daemon=True).start()
+        return True
@@ -0,0 +1,112 @@
+import numpy as np
+from PIL import Image
+
+# --------------------------
+# TEXT PLACEMENT
+# --------------------------
+# Each postcard is analysed once: a small grayscale copy gives a luminance
+# map and an edge-energy map (absolute luminance differences between
+# neighbouring pixels), and both are stored as integral images (summed-area
+# tables). The sum of either map over any rectangle is then four lookups,
+# so every candidate position for the text block is scored in O(1) and all
+# of them are scored at once with NumPy. The calmest box (little edge
+# energy, even luminance) wins, and the text color is chosen to contrast
+# with that box's mean luminance.
+
+ANALYSIS_WIDTH = 160      # width of the analysed copy, in pixels
+PLACEMENT_STEPS = 24      # candidate positions per axis
+VARIATION_WEIGHT = 0.5    # weight of luminance spread vs. edge energy in the score
+DISTANCE_WEIGHT = 2.0     # score penalty for moving the whole diagonal away from the preferred origin
+LIGHT_BACKGROUND = 128    # mean luminance (0-255) from which text is dark
+
+
+def _integral(values):
+    # Zero row and column in front, so box sums need no bounds checks
+    table = np.zeros((values.shape[0] + 1, values.shape[1] + 1), dtype=np.float64)
+    np.cumsum(np.cumsum(values, axis=0), axis=1, out=table[1:, 1:])
+    return table
+
+
+def _box_sums(table, x0, y0, x1, y1):
+    return table[y1, x1] - table[y0, x1] - table[y1, x0] + table[y0, x0]
+
+
+class BackgroundAnalysis:
+    """
+    Integral images of luminance, squared luminance and edge energy for one
+    postcard. Immutable once built, so it can be shared between threads.
+    """
+
+    def __init__(self, image, analysis_width=ANALYSIS_WIDTH):
+        self.size = image.size
+        if image.width > analysis_width:
+            small = image.convert("RGB").resize(
+                (analysis_width, max(1, round(image.height * analysis_width / image.width))), Image.BOX
+            )
+        else:
+            small = image
+        luminance = np.asarray(small.convert("L"), dtype=np.float64)
+        edges = np.zeros_like(luminance)
+        edges[:, 1:] += np.abs(np.diff(luminance, axis=1))
+        edges[1:, :] += np.abs(np.diff(luminance, axis=0))
+        self._scale = (small.width / image.width, small.height / image.height)
+        self._grid = (small.width, small.height)
+        self._luminance = _integral(luminance)
+        self._squares = _integral(luminance ** 2)
+        self._edges = _integral(edges)
+
+    def region_stats(self, box):
+        """
+        (mean luminance, luminance standard deviation, mean edge energy) of
+        box (left, top, right, bottom) in image pixels, all on a 0-255 scale.
+        """
+        x0, y0, x1, y1 = self._grid_boxes(*(np.asarray([v]) for v in box))
+        mean, spread, edges = self._stats(x0, y0, x1, y1)
+        return float(mean[0]), float(spread[0]), float(edges[0])
+
+    def calmest_origin(self, block_size, bounds, preferred=None, steps=PLACEMENT_STEPS):
+        """
+        Top-left corner, within bounds (left, top, right, bottom), of the
+        block_size (width, height) box with the least edge energy and
+        luminance variation, and that box's mean luminance. Boxes far from
+        preferred (an origin) score slightly worse, so on an even background
+        the text stays where it used to be.
+        """
+        width, height = block_size
+        left, top, right, bottom = bounds
+        xs = np.unique(np.linspace(left, max(left, right - width), steps).astype(int))
+        ys = np.unique(np.linspace(top, max(top, bottom - height), steps).astype(int))
+        x, y = (grid.ravel() for grid in np.meshgrid(xs, ys))
+        mean, spread, edges = self._stats(*self._grid_boxes(x, y, x + width, y + height))
+        score = edges + VARIATION_WEIGHT * spread
+        if preferred is not None:
+            distance = np.hypot(x - preferred[0], y - preferred[1]) / np.hypot(*self.size)
+            score = score + DISTANCE_WEIGHT * distance
+        best = int(np.argmin(score))
+        return (int(x[best]), int(y[best])), float(mean[best])
+
+    def _grid_boxes(self, x0, y0, x1, y1):
+        grid_width, grid_height = self._grid
+        scale_x, scale_y = self._scale
+        gx0 = np.clip(np.floor(x0 * scale_x).astype(int), 0, grid_width - 1)
+        gy0 = np.clip(np.floor(y0 * scale_y).astype(int), 0, grid_height - 1)
+        gx1 = np.clip(np.ceil(x1 * scale_x).astype(int), gx0 + 1, grid_width)
+        gy1 = np.clip(np.ceil(y1 * scale_y).astype(int), gy0 + 1, grid_height)
+        return gx0, gy0, gx1, gy1
+
+    def _stats(self, x0, y0, x1, y1):
+        area = (x1 - x0) * (y1 - y0)
+        mean = _box_sums(self._luminance, x0, y0, x1, y1) / area
+        variance = _box_sums(self._squares, x0, y0, x1, y1) / area - mean ** 2
+        return mean, np.sqrt(np.maximum(variance, 0)), _box_sums(self._edges, x0, y0, x1, y1) / area
+
+
+def contrasting_color(mean_luminance, rng, alpha=255):
+    """
+    Random RGBA text color that contrasts with a background of the given
+    mean luminance: dark (channels 0-100) on light backgrounds, light
+    (channels 170-255) on dark ones. Draws three values from rng.
+    """
+    low, high = (0, 100) if mean_luminance >= LIGHT_BACKGROUND else (170, 255)
+    r, g, b = (rng.randint(low, high) for _ in range(3))
+    return (r, g, b, alpha)
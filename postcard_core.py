@@ -0,0 +1,679 @@
+import os
+import json
+import random
+import functools
+import time
+from collections import namedtuple
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asset_manifest import AssetManifest
+from font_registry import FontRegistry
+from font_index import FontCoverageIndex
+from postcard_pool import PostcardPool, load_background
+from llm_cache import ResponseCache, make_cache_key
+from request_scheduler import RequestScheduler
+from metrics import Metrics
+from text_layout import MEASURE_SIZE, TextLayoutEngine, draw_layout, scale_layout
+from image_store import PREVIEW_TIER, PRINT_TIER, RenderStore, display_tier, encode_tier, render_key
+from render_worker import RENDER_WORKERS, RenderJob, RenderUnavailable, RenderWorkers
+
+# --------------------------
+# POSTCARD CORE
+# --------------------------
+# Letter generation, translation and postcard rendering without any
+# Streamlit dependency, shared by both pages (2.py, 1_Postcard_Generator.py)
+# and the batch CLI (batch_postcards.py). Process-wide resources are created
+# lazily once per process, like st.cache_resource does for the app, so a
+# server process serving both pages holds one of each. Where the pages
+# differ (prompt wording, text block, resolution, transparency), they pass
+# their own Prompts and PostcardStyle.
+#
+# Importing this module is cheap and has no side effects: Pillow, NumPy and
+# the openai package are only imported when the first card is rendered or
+# the first API call is made, and the asset manifest (the font and postcard
+# lists) is only read or built when something first needs it.
+
+# --------------------------
+# 1. CONFIGURATION & SETUP
+# --------------------------
+POSTCARD_FOLDER = "./Postcards"
+FONTS_FOLDER = "./Fonts"
+
+@functools.lru_cache(maxsize=None)
+def get_metrics():
+    """
+    Process-wide stage timings, token counts and (optional) event log, shared
+    by both pages, the batch CLI and the benchmarks. Nothing is served until
+    the app calls start_metrics_endpoint().
+    """
+    return Metrics()
+
+@functools.lru_cache(maxsize=None)
+def start_metrics_endpoint():
+    """
+    Serve get_metrics() in Prometheus text format on
+    127.0.0.1:POSTCARD_METRICS_PORT; tried once per process. Returns whether
+    the endpoint is up.
+    """
+    return get_metrics().serve()
+
+@functools.lru_cache(maxsize=None)
+def get_asset_manifest():
+    """
+    Font and postcard metadata (paths, glyph coverage, pixel sizes), read
+    from the manifest and rebuilt only for files whose mtime changed.
+    """
+    start = time.perf_counter()
+    manifest = AssetManifest(FONTS_FOLDER, POSTCARD_FOLDER)
+    get_metrics().observe("startup.manifest", time.perf_counter() - start, rebuilt=len(manifest.rebuilt))
+    return manifest
+
+@functools.lru_cache(maxsize=None)
+def get_font_files():
+    """
+    Handwriting fonts offered at random, from the asset manifest; script fonts
+    (cyrillic.ttf, chinese.ttf) are only picked through the glyph coverage
+    index when a letter needs them.
+    """
+    return [
+        path for path in get_asset_manifest().font_paths()
+        if path.lower().endswith(".ttf") and os.path.basename(path).lower() not in ["cyrillic.ttf", "chinese.ttf"]
+    ]
+
+@functools.lru_cache(maxsize=None)
+def get_font_registry():
+    """
+    One font registry per process, shared across sessions and reruns.
+    The Latin and Cyrillic fonts are measured (and loaded at the layout
+    engine's MEASURE_SIZE) up front; CJK fonts load on first use.
+    """
+    registry = FontRegistry()
+    registry.on_load = lambda font_path, size, seconds: get_metrics().observe(
+        "render.font_load", seconds, font=os.path.basename(font_path or "default"), size=size
+    )
+    registry.warm_up(get_font_files() + [os.path.join(FONTS_FOLDER, "cyrillic.ttf")], sizes=(MEASURE_SIZE,))
+    return registry
+
+@functools.lru_cache(maxsize=None)
+def get_font_index():
+    """
+    Glyph coverage of every font in FONTS_FOLDER, from the asset manifest.
+    """
+    manifest = get_asset_manifest()
+    return FontCoverageIndex({path: manifest.font(path) for path in manifest.font_paths()})
+
+@functools.lru_cache(maxsize=None)
+def get_layout_engine():
+    """
+    Process-wide text layout engine (glyph advances and finished layouts are cached).
+    """
+    return TextLayoutEngine(get_font_registry(), get_font_index())
+
+@functools.lru_cache(maxsize=None)
+def get_postcard_pool():
+    """
+    One postcard pool per process: the folder listing comes from the asset
+    manifest and decoded backgrounds are shared across sessions. Backgrounds
+    are pre-decoded at the default 600×400 render size; pages planning at
+    another size (see PostcardStyle) get their own decodes from the same pool.
+    """
+    manifest = get_asset_manifest()
+    return PostcardPool(
+        POSTCARD_FOLDER, target_size=(600, 400),
+        listing=(manifest.folder_mtime("postcards"), {path: manifest.postcard(path) for path in manifest.postcard_paths()})
+    )
+
+@functools.lru_cache(maxsize=None)
+def get_response_cache():
+    """
+    Disk-backed LLM response cache shared by all sessions (and server restarts).
+    """
+    return ResponseCache()
+
+@functools.lru_cache(maxsize=None)
+def get_render_store():
+    """
+    Process-wide store of encoded postcards (one entry per resolution tier)
+    keyed by render inputs; sessions keep only the key. Evicted renders spill to disk.
+    """
+    return RenderStore()
+
+@functools.lru_cache(maxsize=None)
+def get_render_workers():
+    """
+    Process pool that draws and encodes finished postcards off the server
+    process, or None when POSTCARD_RENDER_WORKERS=0. The workers are started
+    in the background as soon as the pool is created.
+    """
+    if RENDER_WORKERS <= 0:
+        return None
+    workers = RenderWorkers(POSTCARD_FOLDER)
+    metrics = get_metrics()
+
+    def record(job, composite_seconds, encode_seconds):
+        metrics.observe("render.composite", composite_seconds, worker=True)
+        metrics.observe("render.encode", encode_seconds, worker=True)
+
+    workers.on_render = record
+    workers.warm_up()
+    return workers
+
+@functools.lru_cache(maxsize=None)
+def get_background_executor():
+    """
+    Shared thread pool for API calls that can overlap with rendering.
+    Work submitted here must not touch st.* (no script context in worker threads).
+    """
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="postcard-bg")
+
+@functools.lru_cache(maxsize=None)
+def get_request_scheduler():
+    """
+    One OpenAI request scheduler per process (concurrency cap, rate limit,
+    retries and single-flight), shared by both pages, every session and
+    worker thread, so the caps hold for the whole server process.
+    """
+    return RequestScheduler()
+
+_client = None
+_client_options = {}
+_client_lock = threading.Lock()
+
+def set_client(client):
+    """
+    Use client for every API call.
+    """
+    global _client
+    _client = client
+
+def configure_client(**options):
+    """
+    Options (e.g. api_key from st.secrets) for the client get_client() builds
+    on first use; cheap, so the app can call it on every run.
+    """
+    _client_options.update(options)
+
+def get_client():
+    """
+    The OpenAI client set with set_client(), or a pooled one built on first
+    use from configure_client() options (or OPENAI_API_KEY). The openai
+    package is imported here, not at startup.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            from api_client import build_client
+
+            start = time.perf_counter()
+            _client = build_client(**_client_options)
+            get_metrics().observe("startup.client", time.perf_counter() - start)
+        return _client
+
+# -------------------------
+# 2. GPT HELPER FUNCTIONS
+# -------------------------
+# Response cache lifetimes (seconds). Letters and conversation replies are
+# meant to differ every time, so they are never cached.
+TRANSLATION_CACHE_TTL = 30 * 24 * 3600
+CORRECTION_CACHE_TTL = 7 * 24 * 3600
+
+# Wording of the letter, translation and correction requests. letter and
+# correction are str.format templates over friend_name, user_name and
+# target_language, and user_text, target_language and mother_tongue.
+Prompts = namedtuple("Prompts", ["letter_system", "letter", "translator_system", "correction"])
+
+DEFAULT_PROMPTS = Prompts(
+    letter_system="You are writing a letter from your holidays.",
+    letter=(
+        "Write a short (about 80 words) letter to your friend about a random activity on vacation. "
+        "Ask a question to your friend. Write in {target_language} from {friend_name}'s point of view to {user_name} "
+        "and sign the letter as {friend_name}."
+    ),
+    translator_system="You are a translator who preserves the original meaning.",
+    correction=(
+        "You are a language teacher. Correct the mistakes using {target_language} and then explain the mistakes in {mother_tongue}. "
+        "First provide the corrected text in {target_language}, then a bullet list with explanations in {mother_tongue}.\n\n"
+        "Text written in {target_language}:\n\n{user_text}"
+    ),
+)
+
+def chat_completion(stream=False, cache_ttl=None, stage="chat", **request):
+    """
+    Run a chat completion and return the stripped reply text.
+    With stream=True, return a generator that yields text chunks as they arrive.
+    With cache_ttl (seconds), identical requests are answered from the shared
+    response cache without an API call, and identical requests already in
+    flight share one call. Calls go through the process-wide request
+    scheduler at the calling thread's priority (see request_priority()).
+    stage names the call in metrics ("llm.<stage>" timings, tokens, cache hits).
+    """
+    cache = get_response_cache() if cache_ttl else None
+    key = make_cache_key(request) if cache else None
+    if cache:
+        cached = cache.get(key)
+        if cached is not None:
+            get_metrics().record_llm_call(stage, request.get("model"), cached=True)
+            return iter([cached]) if stream else cached
+    if stream:
+        return _stream_chat_completion(request, cache, key, cache_ttl, stage)
+    return get_request_scheduler().call(lambda: _complete(request, cache, key, cache_ttl, stage), key=key)
+
+def _complete(request, cache, key, cache_ttl, stage):
+    metrics = get_metrics()
+    with metrics.timed(f"llm.{stage}", model=request.get("model")) as event:
+        response = get_client().chat.completions.create(**request)
+        usage = response.usage
+        if usage is not None:
+            event.update(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+    metrics.record_llm_call(stage, request.get("model"), usage)
+    content = response.choices[0].message.content.strip()
+    if cache:
+        cache.set(key, content, cache_ttl)
+    return content
+
+def _stream_chat_completion(request, cache=None, key=None, cache_ttl=None, stage="chat"):
+    metrics = get_metrics()
+    parts = []
+    usage = None
+    start = time.perf_counter()
+    # include_usage adds a final chunk (with no choices) carrying the token counts
+    chunks = get_request_scheduler().stream(lambda: get_client().chat.completions.create(
+        stream=True, stream_options={"include_usage": True}, **request
+    ))
+    for chunk in chunks:
+        if chunk.usage is not None:
+            usage = chunk.usage
+        if chunk.choices and chunk.choices[0].delta.content:
+            if not parts:
+                metrics.observe(f"llm.first_token.{stage}", time.perf_counter() - start, model=request.get("model"))
+            parts.append(chunk.choices[0].delta.content)
+            yield parts[-1]
+    event = {"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens} if usage else {}
+    metrics.observe(f"llm.{stage}", time.perf_counter() - start, model=request.get("model"), stream=True, **event)
+    metrics.record_llm_call(stage, request.get("model"), usage)
+    if cache:
+        cache.set(key, "".join(parts).strip(), cache_ttl)
+
+def _letter_prompt(friend_name, user_name, target_language, language_level=None, prompts=DEFAULT_PROMPTS):
+    prompt = prompts.letter.format(friend_name=friend_name, user_name=user_name, target_language=target_language)
+    if language_level:
+        prompt += f" Use vocabulary and grammar suitable for a {language_level} learner."
+    return prompt
+
+def generate_friend_letter(friend_name, user_name, target_language, stream=False, language_level=None,
+                           prompts=DEFAULT_PROMPTS):
+    """
+    Generate a short letter (≈80 words) in target_language from friend_name to user_name.
+    If language_level is given (the batch CLI does), the letter is pitched at
+    that CEFR level; the pages leave it out and keep their original prompt.
+    With stream=True, returns a generator of text chunks instead.
+    """
+    return chat_completion(
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": prompts.letter_system},
+            {"role": "user", "content": _letter_prompt(friend_name, user_name, target_language, language_level, prompts)},
+        ],
+        max_tokens=300,
+        temperature=0.9,
+        stream=stream,
+        stage="letter"
+    )
+
+def translate_to_language(text, target_language, prompts=DEFAULT_PROMPTS):
+    """
+    Ask ChatGPT to translate text into target_language.
+    """
+    prompt = f"Please translate the following text into {target_language}:\n\n{text}."
+    return chat_completion(
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": prompts.translator_system},
+            {"role": "user", "content": prompt},
+        ],
+        max_tokens=300,
+        temperature=0.7,
+        cache_ttl=TRANSLATION_CACHE_TTL,
+        stage="translation"
+    )
+
+def correct_text_in_target_language(user_text, target_language, mother_tongue, stream=False, prompts=DEFAULT_PROMPTS):
+    """
+    Ask ChatGPT to correct and explain mistakes in user_text written in target_language.
+    With stream=True, returns a generator of text chunks instead.
+    """
+    prompt = prompts.correction.format(user_text=user_text, target_language=target_language, mother_tongue=mother_tongue)
+    return chat_completion(
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": "You are a language teacher."},
+            {"role": "user", "content": prompt},
+        ],
+        max_tokens=300,
+        temperature=0.7,
+        stream=stream,
+        cache_ttl=CORRECTION_CACHE_TTL,
+        stage="correction"
+    )
+
+# -------------------------
+# 2a. Batched Translations
+# -------------------------
+# Conversation messages translated per structured request
+TRANSLATION_BATCH_SIZE = 20
+
+def translate_batch(texts, target_language):
+    """
+    Translate several texts into target_language with a single structured request.
+    Returns the translations in input order, falling back to one request per
+    text if the reply is not a JSON list of the right length.
+    """
+    prompt = (
+        f"Translate each string of the JSON array \"texts\" into {target_language}. "
+        "Reply with a JSON object {\"translations\": [...]} holding exactly one translation per input, in the same order.\n\n"
+        + json.dumps({"texts": texts}, ensure_ascii=False)
+    )
+    reply = chat_completion(
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": "You are a translator who preserves the original meaning."},
+            {"role": "user", "content": prompt},
+        ],
+        max_tokens=min(4096, 300 * len(texts)),
+        temperature=0.7,
+        response_format={"type": "json_object"},
+        cache_ttl=TRANSLATION_CACHE_TTL,
+        stage="translation_batch"
+    )
+    try:
+        translations = json.loads(reply)["translations"]
+        if len(translations) == len(texts) and all(isinstance(t, str) for t in translations):
+            return [t.strip() for t in translations]
+    except (ValueError, KeyError, TypeError):
+        pass
+    return [translate_to_language(text, target_language) for text in texts]
+
+# -------------------------
+# 2b. Combined Letter Generation
+# -------------------------
+# Letter, translation and key vocabulary from one schema-constrained request
+# instead of a letter call followed by a translation call.
+# POSTCARD_COMBINED_GENERATION=0 always uses the two separate calls.
+COMBINED_GENERATION = os.environ.get("POSTCARD_COMBINED_GENERATION", "1") != "0"
+MAX_VOCABULARY = 10
+
+LETTER_BUNDLE_SCHEMA = {
+    "name": "letter_bundle",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "letter": {"type": "string"},
+            "translation": {"type": "string"},
+            "vocabulary": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {"word": {"type": "string"}, "meaning": {"type": "string"}},
+                    "required": ["word", "meaning"],
+                    "additionalProperties": False,
+                },
+            },
+        },
+        "required": ["letter", "translation", "vocabulary"],
+        "additionalProperties": False,
+    },
+}
+
+# vocabulary is a list of {"word", "meaning"} dicts (empty if unavailable)
+LetterBundle = namedtuple("LetterBundle", ["letter", "translation", "vocabulary"])
+
+def generate_letter_bundle(friend_name, user_name, target_language, mother_tongue, language_level=None,
+                           prompts=DEFAULT_PROMPTS):
+    """
+    Letter in target_language, its translation into mother_tongue and a few
+    key words from it, as a LetterBundle. Uses a single structured request
+    (see COMBINED_GENERATION), falling back to generate_friend_letter() and
+    translate_to_language() if the reply does not validate.
+    """
+    if COMBINED_GENERATION:
+        prompt = (
+            _letter_prompt(friend_name, user_name, target_language, language_level, prompts)
+            + f" Then translate the letter into {mother_tongue}, keeping its meaning, and list up to "
+            f"{MAX_VOCABULARY} useful words or expressions from the letter (as written in it) with their meaning in {mother_tongue}.\n\n"
+            "Reply with a JSON object with \"letter\", \"translation\" and \"vocabulary\" ([{\"word\", \"meaning\"}, ...])."
+        )
+        reply = chat_completion(
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": prompts.letter_system},
+                {"role": "user", "content": prompt},
+            ],
+            max_tokens=1000,
+            temperature=0.9,
+            response_format={"type": "json_schema", "json_schema": LETTER_BUNDLE_SCHEMA},
+            stage="letter_bundle"
+        )
+        bundle = _parse_letter_bundle(reply)
+        if bundle is not None:
+            return bundle
+        get_metrics().event("llm.letter_bundle.invalid", target_language=target_language)
+
+    letter = generate_friend_letter(friend_name, user_name, target_language, language_level=language_level, prompts=prompts)
+    return LetterBundle(letter, translate_to_language(letter, mother_tongue, prompts), [])
+
+def _parse_letter_bundle(reply):
+    # None unless letter and translation are non-empty strings; bad vocabulary entries are dropped
+    try:
+        data = json.loads(reply)
+        letter, translation = data["letter"].strip(), data["translation"].strip()
+        vocabulary = [
+            {"word": item["word"].strip(), "meaning": item["meaning"].strip()}
+            for item in data.get("vocabulary") or []
+            if isinstance(item, dict) and isinstance(item.get("word"), str) and isinstance(item.get("meaning"), str)
+        ]
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return None
+    if not letter or not translation:
+        return None
+    return LetterBundle(letter, translation, [item for item in vocabulary if item["word"]][:MAX_VOCABULARY])
+
+# --------------------------------
+# 3. IMAGE & TEXT RENDERING LOGIC
+# --------------------------------
+def pick_random_postcard():
+    """
+    Pick a random image from POSTCARD_FOLDER.
+    """
+    return get_postcard_pool().pick_random()
+
+# Everything that determines a rendered card, resolved before drawing
+PostcardPlan = namedtuple("PostcardPlan", ["image_path", "background", "layout", "font", "origin", "color"])
+
+# How a page sets its letters on the postcard:
+# - base_size: (width, height) the card is planned at, or None for the postcard's own size
+# - text_width: widest text block, as a fraction of the width
+# - margin: bottom margin and distance kept from the edges, as a fraction of the height
+# - font_height: nominal text size as a fraction of the height (the font size may
+#   grow to 1.5x that); with cap_height, the height of a capital "A" rather than
+#   the font size
+# - alpha: (low, high) range of the random text opacity, or None for opaque text
+PostcardStyle = namedtuple("PostcardStyle", ["base_size", "text_width", "margin", "font_height", "cap_height", "alpha"])
+
+# 600×400 cards, text up to 60% of the width with "A" about 14 px tall, opaque
+DEFAULT_STYLE = PostcardStyle((600, 400), 0.60, 0.05, 14 / 400, True, None)
+
+def plan_postcard(image_path, text, target_language, style_seed=None, style=DEFAULT_STYLE):
+    """
+    Resolve background, font, layout and color for a postcard without drawing it.
+    - The postcard comes pre-decoded at style.base_size (by default 600×400 pixels)
+      from the shared pool.
+    - The text area extends up to style.text_width of the postcard's width.
+    - Fonts follow the letter's characters (see FontCoverageIndex.choose); target_language
+      no longer picks the font.
+    - Text is wrapped by pixel width and set in the largest font size that fits the letter area.
+    - The text block goes where the postcard is calmest (see BackgroundAnalysis), in a
+      color contrasting with that spot: dark on light backgrounds, light on dark ones.
+    - Passing the same style_seed reproduces the same random font and color (used for previews).
+    """
+    rng = random.Random(style_seed) if style_seed is not None else random
+    # Shared RGBA background from the pool (draw_layout copies it)
+    pool = get_postcard_pool()
+    base_size = style.base_size or pool.source_size(image_path)
+    postcard = pool.get(image_path, base_size)
+    width, height = postcard.size
+
+    # Define letter area (left side); the text block may move anywhere within the margins
+    margin_left = int(width * 0.03)
+    margin_top = int(height * 0.18)
+    margin_edge = int(height * style.margin)
+    max_text_width = int(width * style.text_width)
+    max_text_height = height - margin_top - margin_edge
+
+    # A random handwriting font if one has every glyph of the letter, otherwise
+    # the fonts covering it (e.g. cyrillic.ttf, chinese.ttf) with per-glyph
+    # fallback. Heavy fonts are only loaded when a letter actually needs them.
+    font_chain = get_font_index().choose(text, candidates=get_font_files(), rng=rng)
+
+    # Pick the largest font size that fits the letter area, between a small
+    # floor and 1.5x the nominal size, wrapping by real pixel width. Layouts
+    # are cached, so re-rendering the same letter is free.
+    registry = get_font_registry()
+    engine = get_layout_engine()
+    nominal_size = height * style.font_height
+    with get_metrics().timed("render.layout", chars=len(text)) as event:
+        try:
+            if style.cap_height and font_chain[0]:
+                nominal_size = registry.size_for_char_height(font_chain[0], nominal_size)
+            layout = engine.fit(text, font_chain, (max_text_width, max_text_height), min_size=8, max_size=int(nominal_size * 1.5))
+            font = engine.fonts_for(layout)
+        except OSError:
+            # Missing or unreadable font file: fall back to Pillow's default font
+            layout = engine.fit(
+                text, None, (max_text_width, max_text_height), min_size=8, max_size=int(height * style.font_height * 1.5)
+            )
+            font = registry.get(None, layout.font_size)
+        event.update(font_size=layout.font_size, lines=len(layout.lines))
+
+    # Calmest spot for the laid-out block (O(1) per candidate from the cached
+    # integral images), preferring the classic top-left letter position
+    with get_metrics().timed("render.placement"):
+        origin, luminance = pool.analysis(image_path, base_size).calmest_origin(
+            (layout.width, layout.height),
+            (margin_left, margin_edge, width - margin_left, height - margin_edge),
+            preferred=(margin_left, margin_top)
+        )
+    from placement import contrasting_color
+
+    alpha = rng.randint(*style.alpha) if style.alpha else 255
+    color = contrasting_color(luminance, rng, alpha)
+
+    return PostcardPlan(image_path, postcard, layout, font, origin, color)
+
+def tier_size(plan, tier):
+    """
+    (width, height) at which plan is drawn for tier: the tier's width, or for
+    the print tier the postcard's own width (never less than the planned
+    width), with the planned aspect ratio.
+    """
+    base_width, base_height = plan.background.size
+    full_width = max(base_width, get_postcard_pool().source_size(plan.image_path)[0])
+    width = min(tier.width or full_width, full_width)
+    return width, max(1, round(base_height * width / base_width))
+
+def _scaled(plan, size):
+    # The planned layout and origin, for drawing at size instead of the planned size
+    factor = size[0] / plan.background.width
+    origin = (int(round(plan.origin[0] * factor)), int(round(plan.origin[1] * factor)))
+    return scale_layout(plan.layout, factor), origin
+
+def draw_postcard(plan, size=None, private=False):
+    """
+    Draw a planned postcard, blending only the text's bounding box into a copy of the background.
+    With size (width, height), the same layout is drawn at that resolution.
+    With private=True, the background is decoded for this card alone and drawn
+    on in place: no copy, and no one-off (print) decode is kept in the pool.
+    """
+    background, layout, font, origin = plan.background, plan.layout, plan.font, plan.origin
+    if size is not None and tuple(size) != background.size:
+        layout, origin = _scaled(plan, size)
+        background = None
+        font = get_layout_engine().fonts_for(layout)
+    size = tuple(size or plan.background.size)
+    if private:
+        background = load_background(plan.image_path, size)
+    elif background is None:
+        background = get_postcard_pool().get(plan.image_path, size)
+    with get_metrics().timed("render.composite", size=background.size):
+        return draw_layout(background, layout, font, origin, plan.color, copy_background=not private)
+
+def overlay_text_on_postcard(image_path, text, target_language, style_seed=None, style=DEFAULT_STYLE):
+    """
+    Overlays the provided text on the postcard image (see plan_postcard) and returns the PIL image.
+    """
+    return draw_postcard(plan_postcard(image_path, text, target_language, style_seed, style))
+
+def preview_postcard(image_path, text, target_language, style_seed=None, style=DEFAULT_STYLE):
+    """
+    JPEG bytes of the postcard in the preview tier, drawn in this process and
+    not stored; used for the progressive previews of a letter being written.
+    """
+    plan = plan_postcard(image_path, text, target_language, style_seed, style)
+    return encode_tier(draw_postcard(plan, tier_size(plan, PREVIEW_TIER)), PREVIEW_TIER).data
+
+def render_postcard(image_path, text, target_language, style_seed=None, tier=None, style=DEFAULT_STYLE):
+    """
+    Render and encode a finished postcard in one resolution tier (by default
+    the default display tier) through the shared render store and return its
+    key; an identical card (same postcard, text, fonts, color and tier) is
+    served from the store without drawing or encoding.
+    """
+    return next(render_postcard_tiers(image_path, text, target_language, style_seed, [tier or display_tier()], style))
+
+def render_postcard_tiers(image_path, text, target_language, style_seed, tiers, style=DEFAULT_STYLE):
+    """
+    Store key of the postcard in each of tiers, yielded as soon as that tier
+    is ready (e.g. show the preview while the display tier is drawn). The
+    card is planned once and every tier draws the same layout.
+    """
+    plan = plan_postcard(image_path, text, target_language, style_seed, style)
+    for tier in tiers:
+        yield render_tier(plan, tier)
+
+def render_tier(plan, tier):
+    """
+    Store key of a planned postcard in tier, drawing and encoding it if needed.
+    """
+    size = tier_size(plan, tier)
+    layout = plan.layout
+    key = render_key(
+        plan.image_path, os.path.getmtime(plan.image_path), plan.background.size, layout.lines,
+        layout.font_path, layout.font_size, plan.origin, plan.color, tier.image_format, tier.quality, size
+    )
+    store = get_render_store()
+    if store.get(key) is None:
+        store.put(key, encode_planned_postcard(plan, tier, size))
+    return key
+
+def encode_planned_postcard(plan, tier, size):
+    """
+    Draw a planned postcard at size and encode it for tier in a render worker
+    process, so the server process stays responsive; in this process for
+    previews (small and wanted at once) or if the workers are disabled,
+    saturated, too slow or down.
+    """
+    workers = get_render_workers()
+    if workers is not None and tier.name != PREVIEW_TIER.name:
+        layout, origin = _scaled(plan, size)
+        start = time.perf_counter()
+        try:
+            encoded = workers.render(RenderJob(plan.image_path, size, layout, origin, plan.color, tier))
+        except RenderUnavailable as exc:
+            get_metrics().event("render.worker_unavailable", reason=str(exc))
+        else:
+            get_metrics().observe("render.worker", time.perf_counter() - start, tier=tier.name)
+            return encoded
+    image = draw_postcard(plan, size, private=tier.name == PRINT_TIER.name)
+    with get_metrics().timed("render.encode", size=image.size, tier=tier.name):
+        return encode_tier(image, tier)
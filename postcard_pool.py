@@ -0,0 +1,210 @@
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+
+# --------------------------
+# POSTCARD BACKGROUND POOL
+# --------------------------
+# The postcard folder is listed once and re-listed only when its mtime
+# changes. Decoded backgrounds are kept as ready-to-composite RGBA images,
+# one per size a card is drawn at (see the resolution tiers in image_store),
+# in an LRU bounded by bytes, so a render starts from memory instead of from
+# disk plus a full JPEG decode. Each background's placement analysis
+# (luminance and edge-energy integral images) is computed once per size a
+# card is planned at and kept for as long as the file is unchanged; it is
+# small, so it outlives evictions.
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024  # ~64 MB of decoded RGBA pixels
+RESCAN_INTERVAL = 2.0  # seconds between folder mtime checks
+
+
+def load_background(image_path, target_size=None):
+    """
+    Decode image_path to RGBA, optionally resized to target_size.
+    JPEGs are decoded with draft mode so the DCT scaler does most of the
+    shrinking instead of decoding at full resolution first.
+    """
+    from PIL import Image  # deferred so listing postcards does not import Pillow
+
+    with Image.open(image_path) as img:
+        if target_size is not None and img.format == "JPEG":
+            img.draft(img.mode, target_size)
+        img = img.convert("RGBA")
+    if target_size is not None and img.size != tuple(target_size):
+        img = img.resize(target_size)
+    return img
+
+
+class PostcardPool:
+    """
+    Shared, thread-safe pool of postcard backgrounds.
+
+    Images returned by get() are shared between sessions and must not be
+    drawn on in place; Image.alpha_composite() already returns a new image.
+    """
+
+    def __init__(self, folder, target_size=None, max_bytes=DEFAULT_MAX_BYTES,
+                 rescan_interval=RESCAN_INTERVAL, listing=None):
+        self.folder = folder
+        self.target_size = tuple(target_size) if target_size else None
+        self.max_bytes = max_bytes
+        self.rescan_interval = rescan_interval
+        self._paths = []
+        self._folder_mtime = None
+        self._checked_at = 0.0
+        self._listed = {}  # path -> AssetManifest entry ({"mtime_ns", "width", "height"})
+        if listing is not None:
+            # (folder mtime, {path: entry}) from an AssetManifest: the folder is
+            # only listed again once its mtime no longer matches
+            self._folder_mtime, self._listed = listing[0], dict(listing[1])
+            self._paths = sorted(self._listed)
+        self._images = OrderedDict()  # (path, mtime, size) -> RGBA image
+        self._analyses = {}  # (path, mtime, size) -> BackgroundAnalysis
+        self._source_sizes = {}  # (path, mtime) -> (width, height) on disk
+        self._bytes = 0
+        self._lock = threading.RLock()
+
+    def paths(self):
+        """
+        Postcard paths in the folder, re-listed only when the folder changed.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._folder_mtime is None or now - self._checked_at >= self.rescan_interval:
+                self._checked_at = now
+                self._rescan()
+            return list(self._paths)
+
+    def pick_random(self):
+        paths = self.paths()
+        return random.choice(paths) if paths else None
+
+    def get(self, image_path, size=None):
+        """
+        Ready-to-composite RGBA background for image_path (shared, do not
+        mutate), at size (width, height) or else the pool's target size.
+        """
+        size = tuple(size) if size else self.target_size
+        key = (image_path, _mtime(image_path), size)
+        with self._lock:
+            img = self._images.get(key)
+            if img is not None:
+                self._images.move_to_end(key)
+                return img
+
+        img = load_background(image_path, size)
+
+        with self._lock:
+            if key not in self._images:
+                # A new mtime means the file was replaced; forget older decodes
+                for stale in [k for k in self._images if k[0] == image_path and k[1] != key[1]]:
+                    old = self._images.pop(stale)
+                    self._bytes -= old.width * old.height * 4
+                self._images[key] = img
+                self._bytes += img.width * img.height * 4
+                self._evict()
+        return img
+
+    def source_size(self, image_path):
+        """
+        (width, height) of image_path as stored: from the asset manifest while
+        the file is unchanged, otherwise read from its header once.
+        """
+        key = (image_path, _mtime(image_path))
+        with self._lock:
+            size = self._source_sizes.get(key)
+            entry = self._listed.get(image_path)
+        if size is None and entry is not None:
+            try:
+                if os.stat(image_path).st_mtime_ns == entry["mtime_ns"]:
+                    size = (entry["width"], entry["height"])
+            except OSError:
+                pass
+        if size is None:
+            from PIL import Image
+
+            with Image.open(image_path) as img:  # header only, no decode
+                size = img.size
+            with self._lock:
+                self._source_sizes[key] = size
+        return size
+
+    def analysis(self, image_path, size=None):
+        """
+        BackgroundAnalysis of image_path's background as returned by
+        get(image_path, size), in that image's pixel coordinates.
+        """
+        size = tuple(size) if size else self.target_size
+        key = (image_path, _mtime(image_path), size)
+        with self._lock:
+            analysis = self._analyses.get(key)
+        if analysis is not None:
+            return analysis
+
+        from placement import BackgroundAnalysis  # NumPy is only imported once a card is rendered
+
+        analysis = BackgroundAnalysis(self.get(image_path, size))
+
+        with self._lock:
+            for stale in [k for k in self._analyses if k[0] == image_path and k[1] != key[1]]:
+                del self._analyses[stale]
+            self._analyses[key] = analysis
+        return analysis
+
+    def warm_up(self):
+        """
+        Decode and analyse every postcard once so the first renders hit memory.
+        """
+        for path in self.paths():
+            try:
+                self.analysis(path)
+            except OSError:
+                continue
+
+    def stats(self):
+        with self._lock:
+            return {
+                "postcards": len(self._paths),
+                "cached": len(self._images),
+                "analysed": len(self._analyses),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _rescan(self):
+        try:
+            mtime = os.path.getmtime(self.folder)
+        except OSError:
+            self._paths, self._folder_mtime = [], None
+            return
+        if mtime == self._folder_mtime:
+            return
+        self._folder_mtime = mtime
+        self._paths = sorted(
+            os.path.join(self.folder, f)
+            for f in os.listdir(self.folder)
+            if f.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        # Drop backgrounds whose files disappeared
+        live = set(self._paths)
+        for key in [k for k in self._images if k[0] not in live]:
+            img = self._images.pop(key)
+            self._bytes -= img.width * img.height * 4
+        for cache in (self._analyses, self._source_sizes):
+            for key in [k for k in cache if k[0] not in live]:
+                del cache[key]
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and len(self._images) > 1:
+            _, img = self._images.popitem(last=False)
+            self._bytes -= img.width * img.height * 4
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
@@ -0,0 +1,326 @@
+import importlib
+import os
+import pickle
+import queue
+import struct
+import subprocess
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from font_registry import FontRegistry
+from image_store import PRINT_TIER, encode_tier
+from postcard_pool import PostcardPool, load_background
+from text_layout import TextLayoutEngine, draw_layout
+
+# --------------------------
+# RENDER WORKER POOL
+# --------------------------
+# Drawing a card (rasterizing its glyphs, CJK ones especially, and blending
+# them in) and encoding it hold the GIL for tens of milliseconds, stalling
+# every other session served by the same Streamlit process. Finished cards
+# are therefore drawn in a few worker processes: the server plans the card
+# (layout and placement are cached and cheap) and sends the plan, scaled to
+# the resolution tier; the worker draws and encodes it with its own font
+# registry and postcard pool. Only the encoded JPEG/PNG bytes come back, so
+# no pixels cross the process boundary.
+#
+# Workers are plain `python -m render_worker` subprocesses exchanging
+# length-prefixed pickles over stdin/stdout. multiprocessing's spawn and
+# forkserver start methods would re-run __main__ in every worker, and under
+# Streamlit __main__ is the page script.
+#
+# At most max_pending jobs are waiting or running; further jobs are turned
+# away at once. A job waits for an idle worker and for its result up to
+# timeout seconds in total, and a worker that overruns is killed and
+# replaced. Whenever a job is turned away, times out or its worker dies,
+# RenderUnavailable is raised and the caller renders in-process instead.
+
+# POSTCARD_RENDER_WORKERS=0 renders in the server process, as before
+RENDER_WORKERS = int(os.environ.get("POSTCARD_RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
+RENDER_TIMEOUT = float(os.environ.get("POSTCARD_RENDER_TIMEOUT", "20"))
+PENDING_PER_WORKER = 2  # one job rendering and one waiting behind it
+WORKER_NICENESS = 5     # renders yield the CPU to the server's request threads
+
+_FRAME = struct.Struct("<I")
+_MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# The picklable part of a PostcardPlan, scaled to size (None: the postcard's
+# own size), and the RenderTier to encode it as. The worker resolves the
+# background and fonts itself from the paths.
+RenderJob = namedtuple("RenderJob", ["image_path", "size", "layout", "origin", "color", "tier"])
+
+
+class RenderUnavailable(RuntimeError):
+    """
+    No worker rendered the job (pool full, too slow, worker died or failed);
+    render in-process instead.
+    """
+
+
+def _send(stream, obj):
+    payload = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    stream.write(_FRAME.pack(len(payload)) + payload)
+    stream.flush()
+
+
+def _receive(stream):
+    header = stream.read(_FRAME.size)
+    if len(header) < _FRAME.size:
+        raise EOFError
+    (size,) = _FRAME.unpack(header)
+    payload = stream.read(size)
+    if len(payload) < size:
+        raise EOFError
+    return pickle.loads(payload)
+
+
+# --------------------------
+# Worker process side
+# --------------------------
+_backgrounds = None
+_engine = None
+
+
+def _init_worker(postcards_folder):
+    global _backgrounds, _engine
+    if hasattr(os, "nice"):
+        try:
+            os.nice(WORKER_NICENESS)
+        except OSError:
+            pass
+    for module in ("PIL.Image", "PIL.ImageDraw", "PIL.ImageFont"):
+        importlib.import_module(module)  # while idle, not during the first job
+
+    _backgrounds = PostcardPool(postcards_folder)
+    _engine = TextLayoutEngine(FontRegistry())
+
+
+def _render(job):
+    # (EncodedImage, composite seconds, encode seconds)
+    start = time.perf_counter()
+    if job.tier.name == PRINT_TIER.name:
+        # One-off full-resolution card: decoded for this job and drawn on in place
+        background, private = load_background(job.image_path, job.size), True
+    else:
+        background, private = _backgrounds.get(job.image_path, job.size), False
+    image = draw_layout(
+        background, job.layout, _engine.fonts_for(job.layout), job.origin, job.color, copy_background=not private
+    )
+    drawn = time.perf_counter()
+    encoded = encode_tier(image, job.tier)
+    return encoded, drawn - start, time.perf_counter() - drawn
+
+
+def serve(requests, replies):
+    """
+    Worker main loop: read the init arguments, then answer each RenderJob
+    with (None, result) or (error message, None) until requests is closed.
+    """
+    _init_worker(*_receive(requests))
+    while True:
+        try:
+            job = _receive(requests)
+        except EOFError:
+            return
+        try:
+            reply = (None, _render(job))
+        except Exception as exc:
+            reply = (f"{type(exc).__name__}: {exc}", None)
+        _send(replies, reply)
+
+
+# --------------------------
+# Server process side
+# --------------------------
+class _WorkerProcess:
+    """
+    One worker subprocess, running one job at a time.
+    """
+
+    def __init__(self, initargs):
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [_MODULE_DIR, env.get("PYTHONPATH")]))
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "render_worker"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=env
+        )
+        self.broken = False
+        self._pending = None  # Future of the job being rendered
+        _send(self.process.stdin, initargs)
+        threading.Thread(target=self._read_replies, name="render-worker-replies", daemon=True).start()
+
+    def submit(self, job):
+        future = self._pending = Future()
+        try:
+            _send(self.process.stdin, job)
+        except OSError as exc:
+            self.kill()
+            raise RenderUnavailable("a render worker died") from exc
+        return future
+
+    def alive(self):
+        return not self.broken and self.process.poll() is None
+
+    def kill(self):
+        self.broken = True
+        self.process.kill()
+
+    def close(self):
+        # EOF on stdin ends serve(); the process exits on its own
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+
+    def _read_replies(self):
+        while True:
+            try:
+                error, result = _receive(self.process.stdout)
+            except (EOFError, OSError, pickle.UnpicklingError):
+                self.broken = True
+                future, self._pending = self._pending, None
+                if future is not None:
+                    future.set_exception(RenderUnavailable("a render worker died"))
+                self.process.wait()
+                return
+            future, self._pending = self._pending, None
+            if future is None:
+                continue
+            if error is not None:
+                future.set_exception(RenderUnavailable(f"render failed in worker: {error}"))
+            else:
+                future.set_result(result)
+
+
+class RenderWorkers:
+    """
+    Pool of render worker processes with bounded pending work and timeouts.
+    Workers start on first use (or warm_up()).
+    """
+
+    def __init__(self, postcards_folder, workers=RENDER_WORKERS, max_pending=None, timeout=RENDER_TIMEOUT):
+        self.workers = max(1, workers)
+        self.max_pending = max_pending or self.workers * PENDING_PER_WORKER
+        self.timeout = timeout
+        self.on_render = None  # optional callback(job, composite_seconds, encode_seconds) after a worker render
+        self._initargs = (postcards_folder,)
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._idle = queue.Queue()
+        self._started = 0
+        self._lock = threading.Lock()
+        self._counters = {"jobs": 0, "rejected": 0, "timeouts": 0, "failures": 0, "restarts": 0}
+
+    def render(self, job):
+        """
+        EncodedImage for job, drawn and encoded in a worker process.
+        Raises RenderUnavailable if max_pending jobs are already pending, the
+        job takes longer than timeout (waiting included) or its worker fails.
+        """
+        deadline = time.monotonic() + self.timeout
+        if not self._slots.acquire(blocking=False):
+            self._count("rejected")
+            raise RenderUnavailable(f"{self.max_pending} renders already pending")
+        try:
+            worker = self._checkout(deadline)
+            try:
+                future = worker.submit(job)
+                try:
+                    encoded, composite_seconds, encode_seconds = future.result(
+                        timeout=max(0.0, deadline - time.monotonic())
+                    )
+                except FutureTimeoutError:
+                    worker.kill()  # a running render cannot be cancelled, only killed
+                    self._count("timeouts")
+                    raise RenderUnavailable(f"render took longer than {self.timeout:g}s") from None
+                except RenderUnavailable:
+                    self._count("failures")
+                    raise
+            finally:
+                self._checkin(worker)
+        finally:
+            self._slots.release()
+        self._count("jobs")
+        if self.on_render is not None:
+            self.on_render(job, composite_seconds, encode_seconds)
+        return encoded
+
+    def warm_up(self):
+        """
+        Start every worker process now (each imports Pillow while idle)
+        instead of on the first renders.
+        """
+        while True:
+            with self._lock:
+                if self._started >= self.workers:
+                    return
+                self._started += 1
+            self._idle.put(self._start_worker())
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, workers=self.workers, started=self._started,
+                        idle=self._idle.qsize(), max_pending=self.max_pending)
+
+    def shutdown(self):
+        """
+        Stop the idle workers; busy ones stop when their job is checked in.
+        """
+        with self._lock:
+            self.workers = 0
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            worker.close()
+
+    def _checkout(self, deadline):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            start = self._started < self.workers
+            if start:
+                self._started += 1
+        if start:
+            return self._start_worker()
+        try:
+            return self._idle.get(timeout=max(0.0, deadline - time.monotonic()))
+        except queue.Empty:
+            self._count("timeouts")
+            raise RenderUnavailable(f"no render worker was free within {self.timeout:g}s") from None
+
+    def _checkin(self, worker):
+        if worker.alive() and self._started <= self.workers:
+            self._idle.put(worker)
+            return
+        # Dead, killed or surplus: a fresh worker starts on the next checkout
+        worker.close()
+        with self._lock:
+            self._started -= 1
+            if worker.broken:
+                self._counters["restarts"] += 1
+
+    def _start_worker(self):
+        try:
+            return _WorkerProcess(self._initargs)
+        except OSError as exc:
+            with self._lock:
+                self._started -= 1
+            raise RenderUnavailable("could not start a render worker") from exc
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+
+if __name__ == "__main__":
+    # Replies go to the original stdout; anything printed goes to stderr instead
+    replies = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    serve(sys.stdin.buffer, replies)
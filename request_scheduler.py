@@ -0,0 +1,219 @@
+import functools
+import heapq
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+# --------------------------
+# OPENAI REQUEST SCHEDULER
+# --------------------------
+# Every chat completion goes through one scheduler per process:
+# - at most max_concurrency requests are in flight at once, and waiting
+#   requests are admitted by priority (interactive before background work
+#   before prefetching), then in arrival order;
+# - a token bucket caps the request rate, so bursts of sessions are spread
+#   out instead of tripping the API's rate limit;
+# - rate-limit, timeout, connection and 5xx errors are retried with jittered
+#   exponential backoff (the slot is released while backing off);
+# - identical requests already in flight share one API call (single-flight).
+#
+# openai and tenacity are imported on the first call, so importing the
+# priorities at startup costs nothing.
+
+PRIORITY_INTERACTIVE = 0  # the learner is waiting on this reply
+PRIORITY_BACKGROUND = 1   # overlaps with what the learner is doing (translations, summaries)
+PRIORITY_PREFETCH = 2     # speculative work nobody is waiting for yet
+
+MAX_CONCURRENCY = int(os.environ.get("POSTCARD_OPENAI_CONCURRENCY", "8"))
+REQUESTS_PER_SECOND = float(os.environ.get("POSTCARD_OPENAI_RPS", "8"))
+BURST = 16
+MAX_ATTEMPTS = 5
+
+
+@functools.lru_cache(maxsize=None)
+def retryable_errors():
+    """
+    API errors worth retrying: rate limits, timeouts, connection and 5xx errors.
+    """
+    import openai
+
+    return (
+        openai.RateLimitError,
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        openai.InternalServerError,
+    )
+
+
+_priority = threading.local()
+
+
+@contextmanager
+def request_priority(priority):
+    """
+    Run the block's API calls (on this thread) at the given priority.
+    """
+    previous = getattr(_priority, "value", PRIORITY_INTERACTIVE)
+    _priority.value = priority
+    try:
+        yield
+    finally:
+        _priority.value = previous
+
+
+def current_priority():
+    return getattr(_priority, "value", PRIORITY_INTERACTIVE)
+
+
+def run_with_priority(priority, fn, *args, **kwargs):
+    """
+    fn(*args, **kwargs) at the given priority; handy for executor.submit().
+    """
+    with request_priority(priority):
+        return fn(*args, **kwargs)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled at rate tokens per second, holding at most capacity.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take one token, sleeping until one is available. Returns the time waited.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class RequestScheduler:
+    """
+    Concurrency cap, rate limit, retries and single-flight for API calls.
+    """
+
+    def __init__(self, max_concurrency=MAX_CONCURRENCY, requests_per_second=REQUESTS_PER_SECOND,
+                 burst=BURST, max_attempts=MAX_ATTEMPTS):
+        self.max_concurrency = max_concurrency
+        self.max_attempts = max_attempts
+        self._bucket = TokenBucket(requests_per_second, burst)
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = []  # heap of (priority, sequence)
+        self._sequence = itertools.count()
+        self._inflight = {}  # single-flight key -> Future
+        self._counters = {"requests": 0, "retries": 0, "coalesced": 0}
+
+    def call(self, fn, key=None, priority=None):
+        """
+        Return fn() (an API call), scheduled and retried. Concurrent calls
+        with the same non-None key share the first caller's result.
+        """
+        if key is None:
+            return self._call_with_retries(fn, priority)
+        with self._cond:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self._counters["coalesced"] += 1
+        if not leader:
+            return future.result()
+        try:
+            result = self._call_with_retries(fn, priority)
+            future.set_result(result)
+            return result
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        finally:
+            with self._cond:
+                self._inflight.pop(key, None)
+
+    def stream(self, open_stream, priority=None):
+        """
+        Iterate over the chunks of open_stream() (a streaming API call). The
+        call is retried until it opens; its slot is held until the stream is
+        fully read or closed.
+        """
+        priority = current_priority() if priority is None else priority
+        for attempt in self._retrying():
+            with attempt:
+                self._acquire(priority)
+                try:
+                    stream = open_stream()
+                except BaseException:
+                    self._release()
+                    raise
+        try:
+            yield from stream
+        finally:
+            self._release()
+
+    def stats(self):
+        with self._cond:
+            return dict(self._counters, active=self._active, waiting=len(self._waiting),
+                        inflight_keys=len(self._inflight))
+
+    def _call_with_retries(self, fn, priority):
+        priority = current_priority() if priority is None else priority
+        for attempt in self._retrying():
+            with attempt:
+                self._acquire(priority)
+                try:
+                    return fn()
+                finally:
+                    self._release()
+
+    def _retrying(self):
+        from tenacity import Retrying, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+
+        return Retrying(
+            retry=retry_if_exception_type(retryable_errors()),
+            wait=wait_random_exponential(multiplier=0.5, max=20),
+            stop=stop_after_attempt(self.max_attempts),
+            before_sleep=self._count_retry,
+            reraise=True,
+        )
+
+    def _count_retry(self, retry_state):
+        with self._cond:
+            self._counters["retries"] += 1
+
+    def _acquire(self, priority):
+        ticket = (priority, next(self._sequence))
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            while self._active >= self.max_concurrency or self._waiting[0] != ticket:
+                self._cond.wait()
+            heapq.heappop(self._waiting)
+            self._active += 1
+            self._counters["requests"] += 1
+            # Let the next waiter check for a free slot too
+            self._cond.notify_all()
+        self._bucket.acquire()
+
+    def _release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
@@ -0,0 +1,139 @@
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# --------------------------
+# PER-USER SETTINGS STORE
+# --------------------------
+# Learner settings (names, languages, level) are kept per user in a small
+# SQLite database in WAL mode, so concurrent sessions and server processes
+# never see a half-written file. Reads are served from an in-process cache;
+# writes update the cache at once and are flushed to disk in one
+# transaction shortly afterwards, so a burst of edits costs one write.
+#
+# Only the values a user has changed are stored; the defaults are merged in
+# on read, so changing a default reaches every user who has not overridden it.
+
+# POSTCARD_SETTINGS_PATH lets deployments keep settings on a persistent volume
+DEFAULT_SETTINGS_PATH = os.environ.get("POSTCARD_SETTINGS_PATH", os.path.join("data", "settings.sqlite3"))
+FLUSH_DELAY = 2.0  # seconds to wait for more edits before writing
+MAX_CACHED_USERS = 1024
+
+
+class SettingsStore:
+    """
+    Thread-safe per-user settings with a read cache and coalesced writes.
+    get() returns a copy of the user's settings merged over defaults; the
+    cache and the database hold only each user's own changes.
+    """
+
+    def __init__(self, path=DEFAULT_SETTINGS_PATH, defaults=None, flush_delay=FLUSH_DELAY,
+                 max_cached=MAX_CACHED_USERS):
+        self.path = path
+        self.defaults = dict(defaults or {})
+        self.flush_delay = flush_delay
+        self.max_cached = max_cached
+        self._cache = OrderedDict()  # user_id -> changed settings only
+        self._dirty = set()
+        self._timer = None
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS settings ("
+            " user_id TEXT PRIMARY KEY,"
+            " data TEXT NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        # Pending edits must not be lost when the server stops
+        atexit.register(self.flush)
+
+    def get(self, user_id):
+        """
+        Settings for user_id: stored values over the defaults.
+        """
+        with self._lock:
+            return dict(self.defaults, **self._overrides(user_id))
+
+    def update(self, user_id, **changes):
+        """
+        Change some of user_id's settings. The cache is updated immediately;
+        the disk write is deferred by flush_delay and merged with later edits.
+        """
+        with self._lock:
+            overrides = self._overrides(user_id)
+            current = dict(self.defaults, **overrides)
+            if all(current.get(name) == value for name, value in changes.items()):
+                return current
+            overrides = dict(overrides, **changes)
+            self._remember(user_id, overrides)
+            self._dirty.add(user_id)
+            if self._timer is None:
+                self._timer = threading.Timer(self.flush_delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+            return dict(self.defaults, **overrides)
+
+    def flush(self):
+        """
+        Write all pending edits in one transaction.
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            pending = [(user_id, json.dumps(self._cache[user_id], ensure_ascii=False), time.time())
+                       for user_id in self._dirty if user_id in self._cache]
+            self._dirty.clear()
+            if not pending:
+                return
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO settings (user_id, data, updated_at) VALUES (?, ?, ?)", pending
+                )
+                self._conn.execute("COMMIT")
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def stats(self):
+        with self._lock:
+            return {"cached_users": len(self._cache), "pending_writes": len(self._dirty)}
+
+    def _overrides(self, user_id):
+        # The user's stored changes, from the cache or the database; call with the lock held
+        overrides = self._cache.get(user_id)
+        if overrides is not None:
+            self._cache.move_to_end(user_id)
+            return overrides
+        row = self._conn.execute("SELECT data FROM settings WHERE user_id = ?", (user_id,)).fetchone()
+        overrides = {}
+        if row is not None:
+            try:
+                stored = json.loads(row[0])
+            except ValueError:
+                stored = {}  # unreadable record: fall back to the defaults
+            # Older records hold every default too; keep only the values that differ
+            overrides = {name: value for name, value in stored.items()
+                         if name not in self.defaults or self.defaults[name] != value}
+        self._remember(user_id, overrides)
+        return overrides
+
+    def _remember(self, user_id, settings):
+        self._cache[user_id] = settings
+        self._cache.move_to_end(user_id)
+        # Users with unsaved edits stay cached until they are flushed
+        while len(self._cache) > self.max_cached:
+            oldest = next(iter(self._cache))
+            if oldest in self._dirty:
+                break
+            self._cache.popitem(last=False)
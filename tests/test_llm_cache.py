@@ -0,0 +1,74 @@
+import os
+import subprocess
+import sys
+
+from llm_cache import ResponseCache, make_cache_key
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+REQUEST = {
+    "model": "gpt-4o-mini",
+    "messages": [{"role": "user", "content": "Translate: Cześć!"}],
+    "temperature": 0,
+}
+
+# Run in a separate interpreter: argv is the database path, the operation
+# ("get" or "set") and the key, plus the content for "set"
+CHILD = """
+import sys
+from llm_cache import ResponseCache
+
+path, operation, key = sys.argv[1:4]
+cache = ResponseCache(path)
+if operation == "set":
+    cache.set(key, sys.argv[4], ttl=60)
+else:
+    print(repr(cache.get(key)), cache.hits, cache.misses)
+"""
+
+
+def in_other_process(path, *args):
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD, str(path), *args], cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    return result.stdout.strip()
+
+
+def test_key_ignores_fields_that_do_not_change_the_reply():
+    assert make_cache_key(dict(REQUEST, stream=True, timeout=10)) == make_cache_key(REQUEST)
+    assert make_cache_key(dict(REQUEST, temperature=0.9)) != make_cache_key(REQUEST)
+
+
+def test_hit_miss_and_expiry(tmp_path):
+    cache = ResponseCache(tmp_path / "cache.sqlite3")
+    key = make_cache_key(REQUEST)
+    assert cache.get(key) is None
+    cache.set(key, "Hello!", ttl=60)
+    assert cache.get(key) == "Hello!"
+    cache.set(key, "Hello!", ttl=-1)
+    assert cache.get(key) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_reply_stored_by_another_process_is_a_hit(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+    # Open before the other process writes: WAL readers see later commits
+    cache = ResponseCache(path)
+    key = make_cache_key(REQUEST)
+    assert cache.get(key) is None
+
+    in_other_process(path, "set", key, "Hello!")
+
+    assert cache.get(key) == "Hello!"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_reply_stored_here_is_a_hit_in_another_process(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+    cache = ResponseCache(path)
+    key = make_cache_key(REQUEST)
+    cache.set(key, "Hello!", ttl=60)
+
+    assert in_other_process(path, "get", key) == "'Hello!' 1 0"
+    assert in_other_process(path, "get", make_cache_key(dict(REQUEST, temperature=0.5))) == "None 0 1"
+
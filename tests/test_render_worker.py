@@ -0,0 +1,69 @@
+import pytest
+
+import postcard_core
+from image_store import display_tier
+from render_worker import RenderJob, RenderUnavailable, RenderWorkers
+
+
+@pytest.fixture(scope="module")
+def plan():
+    image_path = postcard_core.get_postcard_pool().paths()[0]
+    return postcard_core.plan_postcard(image_path, "Cześć! Jak się masz? Pozdrawiam, Zak", "Polish", style_seed=7)
+
+
+@pytest.fixture
+def make_workers():
+    pools = []
+
+    def make(**options):
+        pools.append(RenderWorkers(postcard_core.POSTCARD_FOLDER, workers=1, **options))
+        return pools[-1]
+
+    yield make
+    for pool in pools:
+        pool.shutdown()
+
+
+def render_in_process(plan, tier, monkeypatch):
+    with monkeypatch.context() as patch:
+        patch.setattr(postcard_core, "get_render_workers", lambda: None)
+        return postcard_core.encode_planned_postcard(plan, tier, postcard_core.tier_size(plan, tier))
+
+
+def test_worker_renders_what_the_server_would(plan, make_workers, monkeypatch):
+    tier = display_tier()
+    size = postcard_core.tier_size(plan, tier)
+    layout, origin = postcard_core._scaled(plan, size)
+    workers = make_workers(timeout=60)
+
+    encoded = workers.render(RenderJob(plan.image_path, size, layout, origin, plan.color, tier))
+
+    assert encoded == render_in_process(plan, tier, monkeypatch)
+    assert workers.stats()["jobs"] == 1
+
+
+def test_timed_out_worker_is_killed_and_replaced(plan, make_workers):
+    tier = display_tier()
+    size = postcard_core.tier_size(plan, tier)
+    layout, origin = postcard_core._scaled(plan, size)
+    # Far less than it takes a fresh worker to import Pillow and draw the card
+    workers = make_workers(timeout=0.01)
+
+    with pytest.raises(RenderUnavailable, match="longer than"):
+        workers.render(RenderJob(plan.image_path, size, layout, origin, plan.color, tier))
+
+    stats = workers.stats()
+    assert (stats["timeouts"], stats["restarts"], stats["started"], stats["jobs"]) == (1, 1, 0, 0)
+
+
+def test_worker_timeout_falls_back_to_in_process_rendering(plan, make_workers, monkeypatch):
+    tier = display_tier()
+    expected = render_in_process(plan, tier, monkeypatch)
+    workers = make_workers(timeout=0.01)
+    monkeypatch.setattr(postcard_core, "get_render_workers", lambda: workers)
+
+    encoded = postcard_core.encode_planned_postcard(plan, tier, postcard_core.tier_size(plan, tier))
+
+    assert encoded == expected
+    assert workers.stats()["timeouts"] == 1
+
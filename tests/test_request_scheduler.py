@@ -0,0 +1,136 @@
+import threading
+import time
+
+import pytest
+
+from request_scheduler import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, PRIORITY_PREFETCH, RequestScheduler
+
+
+def make_scheduler(max_concurrency):
+    # A bucket large enough that the rate limit never delays these tests
+    return RequestScheduler(max_concurrency=max_concurrency, requests_per_second=1000, burst=100, max_attempts=1)
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out waiting for the scheduler"
+        time.sleep(0.001)
+
+
+def start(target, *args):
+    thread = threading.Thread(target=target, args=args, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_identical_requests_in_flight_share_one_call():
+    scheduler = make_scheduler(max_concurrency=4)
+    followers = 5
+    release = threading.Event()
+    calls = []
+    results = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return "reply"
+
+    threads = [start(lambda: results.append(scheduler.call(fetch, key="same request"))) for _ in range(followers + 1)]
+    wait_until(lambda: scheduler.stats()["coalesced"] == followers)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert results == ["reply"] * (followers + 1)
+    assert scheduler.stats()["requests"] == 1
+    assert scheduler.stats()["inflight_keys"] == 0
+
+
+def test_followers_receive_the_leaders_error():
+    scheduler = make_scheduler(max_concurrency=4)
+    release = threading.Event()
+    errors = []
+
+    def fetch():
+        release.wait(5)
+        raise ValueError("bad request")
+
+    def caller():
+        try:
+            scheduler.call(fetch, key="same request")
+        except ValueError as exc:
+            errors.append(str(exc))
+
+    threads = [start(caller) for _ in range(3)]
+    wait_until(lambda: scheduler.stats()["coalesced"] == 2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert errors == ["bad request"] * 3
+
+
+def test_requests_without_a_key_are_not_shared():
+    scheduler = make_scheduler(max_concurrency=4)
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return len(calls)
+
+    assert [scheduler.call(fetch), scheduler.call(fetch)] == [1, 2]
+    assert scheduler.stats()["coalesced"] == 0
+
+
+def test_waiting_requests_are_admitted_by_priority_then_arrival():
+    scheduler = make_scheduler(max_concurrency=1)
+    release = threading.Event()
+    order = []
+
+    def hold_slot():
+        release.wait(5)
+
+    blocker = start(scheduler.call, hold_slot, None, PRIORITY_INTERACTIVE)
+    wait_until(lambda: scheduler.stats()["active"] == 1)
+
+    # Queue behind the busy slot in the opposite order of their priority
+    queued = [
+        ("prefetch", PRIORITY_PREFETCH),
+        ("background 1", PRIORITY_BACKGROUND),
+        ("interactive", PRIORITY_INTERACTIVE),
+        ("background 2", PRIORITY_BACKGROUND),
+    ]
+    threads = []
+    for count, (name, priority) in enumerate(queued, start=1):
+        threads.append(start(scheduler.call, lambda name=name: order.append(name), None, priority))
+        wait_until(lambda count=count: scheduler.stats()["waiting"] == count)
+
+    release.set()
+    for thread in [blocker] + threads:
+        thread.join(5)
+
+    assert order == ["interactive", "background 1", "background 2", "prefetch"]
+
+
+@pytest.mark.parametrize("max_concurrency", [1, 3])
+def test_concurrency_never_exceeds_the_cap(max_concurrency):
+    scheduler = make_scheduler(max_concurrency=max_concurrency)
+    lock = threading.Lock()
+    running = [0]
+    peak = [0]
+
+    def fetch():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.01)
+        with lock:
+            running[0] -= 1
+
+    threads = [start(scheduler.call, fetch) for _ in range(8)]
+    for thread in threads:
+        thread.join(5)
+
+    assert 1 <= peak[0] <= max_concurrency
@@ -0,0 +1,289 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict, namedtuple
+
+# --------------------------
+# TEXT LAYOUT ENGINE
+# --------------------------
+# Wraps letters by real pixel width instead of a character count. Glyph
+# advances are measured once per (font, size) and summed afterwards, the
+# largest font size that fits the letter area is found by binary search, and
+# finished layouts are cached by (text hash, font, box, size range), so a
+# repeated layout is a dictionary lookup.
+#
+# A font may also be given as a chain (tuple of paths, primary first, see
+# FontCoverageIndex.choose): each character is then measured and drawn with
+# the first font in the chain that has a glyph for it, and each line of the
+# layout is split into runs of consecutive characters sharing a font.
+
+MAX_ADVANCE_TABLES = 256
+LAYER_PADDING = 0.5  # extra room around the text block, in font sizes, for swashes and descenders
+MAX_LAYOUTS = 512
+LINE_SPACING = 1.2  # line height as a multiple of the font size
+# Glyph advances are measured at this size and scaled linearly while fit()
+# searches for a size, so only the chosen size is ever loaded; large enough
+# that hinting's rounding to whole pixels barely shows in the estimate
+MEASURE_SIZE = 64
+
+# runs is None for single-font layouts, else per line a tuple of (x offset, text, font path)
+Layout = namedtuple(
+    "Layout", ["lines", "font_path", "font_size", "line_height", "width", "height", "runs"], defaults=(None,)
+)
+
+# CJK ideographs, kana, hangul and full-width forms may break between any two
+# characters; everything else breaks at whitespace
+_CJK = "\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef"
+_UNITS = re.compile(rf"[{_CJK}]|[^\s{_CJK}]+|\s+")
+
+
+def line_height_for(font_size):
+    return int(round(font_size * LINE_SPACING))
+
+
+class TextLayoutEngine:
+    """
+    Pixel-accurate word wrapping and auto-fit sizing on top of a FontRegistry.
+    With a FontCoverageIndex, font chains fall back per glyph.
+    """
+
+    def __init__(self, registry, coverage=None, max_tables=MAX_ADVANCE_TABLES, max_layouts=MAX_LAYOUTS):
+        self.registry = registry
+        self.coverage = coverage
+        self.max_tables = max_tables
+        self.max_layouts = max_layouts
+        self._advances = OrderedDict()  # (path or chain, size) -> {char: advance in px}
+        self._layouts = OrderedDict()   # layout key -> Layout
+        self._lock = threading.Lock()
+
+    def text_width(self, text, font_path, font_size):
+        """
+        Width of text in pixels, from the cached glyph-advance table.
+        """
+        return self._width(text, self._advance_table(font_path, font_size), font_path, font_size)
+
+    def wrap(self, text, font_path, font_size, max_width):
+        """
+        Lines of text that each fit within max_width pixels. Paragraph breaks
+        are kept, words longer than a line are split between characters.
+        """
+        table = self._advance_table(font_path, font_size)
+        return self._wrap(text, lambda unit: self._width(unit, table, font_path, font_size), max_width)
+
+    def _wrap(self, text, measure, max_width):
+        # wrap() with text widths from measure(text)
+        space = measure(" ")
+        lines = []
+        for paragraph in text.split("\n"):
+            line, line_width = "", 0.0
+            pending_space = False
+            for unit in _UNITS.findall(paragraph):
+                if unit.isspace():
+                    pending_space = bool(line)
+                    continue
+                unit_width = measure(unit)
+                gap = space if pending_space else 0.0
+                if line and line_width + gap + unit_width <= max_width:
+                    line += (" " if gap else "") + unit
+                    line_width += gap + unit_width
+                elif unit_width <= max_width:
+                    if line:
+                        lines.append(line)
+                    line, line_width = unit, unit_width
+                else:
+                    # Word wider than the box: break it between characters
+                    if line:
+                        lines.append(line)
+                    line, line_width = "", 0.0
+                    for char in unit:
+                        char_width = measure(char)
+                        if line and line_width + char_width > max_width:
+                            lines.append(line)
+                            line, line_width = "", 0.0
+                        line += char
+                        line_width += char_width
+                pending_space = False
+            if line:
+                lines.append(line)  # blank paragraphs are skipped, as textwrap did
+        return lines
+
+    def fit(self, text, font_path, box, min_size=8, max_size=48):
+        """
+        Layout of text in the largest font size in [min_size, max_size] whose
+        wrapped lines fit box (width, height). Falls back to min_size if
+        nothing fits.
+
+        The search wraps with advances scaled from MEASURE_SIZE; only the
+        chosen size is measured for real (and, if rounding made it too
+        large, the next smaller ones), so a fit loads one or two font sizes
+        instead of one per size tried.
+        """
+        box = (int(box[0]), int(box[1]))
+        key = (hashlib.sha1(text.encode("utf-8")).hexdigest(), font_path, box, int(min_size), int(max_size))
+        with self._lock:
+            layout = self._layouts.get(key)
+            if layout is not None:
+                self._layouts.move_to_end(key)
+                return layout
+
+        low, high = int(min_size), max(int(min_size), int(max_size))
+        reference = self._advance_table(font_path, MEASURE_SIZE)
+        while low < high:
+            mid = (low + high + 1) // 2
+            scale = mid / MEASURE_SIZE
+            candidate = self._layout(
+                text, mid, box[0], lambda unit: self._width(unit, reference, font_path, MEASURE_SIZE) * scale
+            )
+            if candidate.height <= box[1] and candidate.width <= box[0]:
+                low = mid
+            else:
+                high = mid - 1
+        while True:
+            table = self._advance_table(font_path, low)
+            best = self._layout(text, low, box[0], lambda unit: self._width(unit, table, font_path, low), font_path)
+            if low <= min_size or (best.height <= box[1] and best.width <= box[0]):
+                break
+            low -= 1
+        if isinstance(font_path, tuple) and len(font_path) > 1:
+            best = best._replace(runs=tuple(self._line_runs(line, best) for line in best.lines))
+
+        with self._lock:
+            self._layouts[key] = best
+            while len(self._layouts) > self.max_layouts:
+                self._layouts.popitem(last=False)
+        return best
+
+    def _layout(self, text, font_size, max_width, measure, font_path=None):
+        lines = self._wrap(text, measure, max_width)
+        width = max((measure(line) for line in lines), default=0)
+        line_height = line_height_for(font_size)
+        return Layout(lines, font_path, font_size, line_height, int(width), line_height * len(lines))
+
+    def fonts_for(self, layout):
+        """
+        Fonts needed to draw layout: a single FreeTypeFont, or for multi-font
+        layouts a {font path: FreeTypeFont} dict of the fonts its runs use
+        (fallback fonts the text never needs are not loaded).
+        """
+        if layout.runs is None:
+            primary = layout.font_path[0] if isinstance(layout.font_path, tuple) else layout.font_path
+            return self.registry.get(primary, layout.font_size)
+        paths = {path for line_runs in layout.runs for _, _, path in line_runs}
+        return {path: self.registry.get(path, layout.font_size) for path in paths}
+
+    def _font_for(self, char, chain):
+        # First font in the chain with a glyph for char; the primary font otherwise
+        for font_path in chain:
+            if self.coverage is None or self.coverage.covers(font_path, char):
+                return font_path
+        return chain[0]
+
+    def _line_runs(self, line, layout):
+        chain = layout.font_path
+        table = self._advance_table(chain, layout.font_size)
+        runs, x_offset = [], 0.0
+        run_text, run_font = "", None
+        for char in line:
+            char_font = run_font if char.isspace() and run_font else self._font_for(char, chain)
+            if run_text and char_font != run_font:
+                runs.append((x_offset, run_text, run_font))
+                x_offset += self._width(run_text, table, chain, layout.font_size)
+                run_text = ""
+            run_text += char
+            run_font = char_font
+        if run_text:
+            runs.append((x_offset, run_text, run_font))
+        return tuple(runs)
+
+    def _advance_table(self, font_path, font_size):
+        key = (font_path, int(font_size))
+        with self._lock:
+            table = self._advances.get(key)
+            if table is not None:
+                self._advances.move_to_end(key)
+                return table
+            table = self._advances[key] = {}
+            while len(self._advances) > self.max_tables:
+                self._advances.popitem(last=False)
+            return table
+
+    def _width(self, text, table, font_path, font_size):
+        width = 0.0
+        for char in text:
+            advance = table.get(char)
+            if advance is None:
+                # First sighting of this glyph at this size: measure it once
+                if isinstance(font_path, tuple):
+                    char_font_path = self._font_for(char, font_path)
+                else:
+                    char_font_path = font_path
+                advance = table[char] = self.registry.get(char_font_path, font_size).getlength(char)
+            width += advance
+        return width
+
+
+def scale_layout(layout, factor):
+    """
+    layout for drawing factor times as large as it was fitted: the same lines
+    (so the same line breaks) with the font size, line height, block size
+    and run offsets scaled. Text is not re-measured, so every resolution of
+    a card looks the same.
+    """
+    if factor == 1:
+        return layout
+    runs = layout.runs
+    if runs is not None:
+        runs = tuple(tuple((x_offset * factor, text, path) for x_offset, text, path in line_runs) for line_runs in runs)
+    line_height = max(1, int(round(layout.line_height * factor)))
+    return layout._replace(
+        font_size=max(1, int(round(layout.font_size * factor))),
+        line_height=line_height,
+        width=int(round(layout.width * factor)),
+        height=line_height * len(layout.lines),
+        runs=runs,
+    )
+
+
+def draw_layout(background, layout, font, origin, fill, copy_background=True):
+    """
+    Draw layout onto background (RGBA) at origin (x, y) and return the result.
+    font is a FreeTypeFont, or for multi-font layouts the {font path: font}
+    dict returned by TextLayoutEngine.fonts_for().
+
+    Text is drawn into a transparent layer only as large as the text block
+    (plus padding) and blended into that region alone, instead of a
+    full-frame overlay composited over the whole image. By default the
+    background is left untouched and the result is a new RGB image, the one
+    full-frame buffer made: the opaque frame the encoders take anyway. Pass
+    copy_background=False when background is a private image that may be
+    drawn on in place; it is then returned itself, still RGBA.
+    """
+    pad = int(layout.font_size * LAYER_PADDING) + 1
+    left = max(0, int(origin[0]) - pad)
+    top = max(0, int(origin[1]) - pad)
+    right = min(background.width, int(origin[0]) + layout.width + pad)
+    bottom = min(background.height, int(origin[1]) + layout.height + pad)
+
+    if right <= left or bottom <= top or not layout.lines:
+        return background.convert("RGB") if copy_background else background
+
+    from PIL import Image, ImageDraw
+
+    # The text is one color, so only its coverage (times the fill's alpha) is
+    # drawn, into a one-byte mask; the fill is then blended through it
+    mask = Image.new("L", (right - left, bottom - top), 0)
+    draw = ImageDraw.Draw(mask)
+    opacity = fill[3] if len(fill) > 3 else 255
+    y_offset = origin[1] - top
+    for i, line in enumerate(layout.lines):
+        if layout.runs is None:
+            draw.text((origin[0] - left, y_offset), line, font=font, fill=opacity)
+        else:
+            for x_offset, run_text, run_font in layout.runs[i]:
+                draw.text((origin[0] - left + x_offset, y_offset), run_text, font=font[run_font], fill=opacity)
+        y_offset += layout.line_height
+
+    result = background.convert("RGB") if copy_background else background
+    color = tuple(fill[:3]) + ((255,) if result.mode == "RGBA" else ())
+    result.paste(color, (left, top, right, bottom), mask)
+    return result